@@ -0,0 +1,166 @@
+import os
+import queue
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+
+from DownloadSourcePage import DownloadSourcePage, URL_CAFEF, URL_VIETSTOCK
+
+# Nguồn dữ liệu -> (hàm tải của DownloadSourcePage, mẫu URL mặc định)
+SOURCES = {
+    'LSGD': ('download_source_trans_his', URL_CAFEF),
+    'BCTC': ('download_source_summary', URL_VIETSTOCK),
+}
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_directory(directory, port=0):
+    """
+    Phục vụ một thư mục (ví dụ data/) qua HTTP cục bộ trong một thread nền,
+    dùng để chạy thử bộ tải với các trang HTML đã lưu thay vì website thật.
+
+    Returns:
+    --------
+    (server, base_url) - gọi server.shutdown() khi dùng xong
+    """
+    handler = partial(_QuietHandler, directory=str(directory))
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+class DownloadScheduler:
+    """
+    Tải song song nhiều mã cổ phiếu: một hàng đợi job (mã, nguồn) và một pool
+    các driver Chrome headless, mỗi worker giữ và tái sử dụng một driver.
+    Job lỗi được đưa lại vào hàng đợi tối đa max_retries lần (driver được khởi tạo lại).
+    """
+
+    def __init__(self, output_dir, num_workers=4, headless=True, max_retries=3,
+                 retry_delay=5, timeout=10, url_templates=None, incremental=False, compact=True):
+        self.output_dir = output_dir
+        self.compact = compact
+        # incremental=True: LSGD chỉ tải các phiên mới hơn mốc trong manifest của từng mã
+        self.incremental = incremental
+        self.num_workers = num_workers
+        self.headless = headless
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        # Cho phép thay URL (ví dụ trỏ tới serve_directory khi chạy thử)
+        self.url_templates = {source: url for source, (_, url) in SOURCES.items()}
+        if url_templates:
+            self.url_templates.update(url_templates)
+
+        self.jobs = queue.Queue()
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def add_job(self, stock_code, source):
+        if source not in SOURCES:
+            raise ValueError(f"Nguồn '{source}' không hợp lệ, chọn một trong {list(SOURCES)}")
+        self.jobs.put((stock_code, source, 1))
+
+    def add_jobs(self, stock_codes, sources=('LSGD', 'BCTC')):
+        for stock_code in stock_codes:
+            for source in sources:
+                self.add_job(stock_code, source)
+
+    def _run_job(self, bot, stock_code, source):
+        method_name, _ = SOURCES[source]
+        url = self.url_templates[source].format(stock_code=stock_code)
+        if source == 'LSGD':
+            bot.download_source_trans_his(stock_code, url, self.output_dir, incremental=self.incremental)
+        else:
+            getattr(bot, method_name)(stock_code, url, self.output_dir)
+
+    def _requeue(self, job):
+        self.jobs.put(job)
+        self.jobs.task_done()
+
+    def _worker(self):
+        bot = None
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                break
+
+            stock_code, source, attempt = job
+            try:
+                if bot is None:
+                    bot = DownloadSourcePage(headless=self.headless, timeout=self.timeout, compact=self.compact)
+                self._run_job(bot, stock_code, source)
+                status, error = 'ok', None
+            except Exception as e:
+                status, error = 'failed', str(e)
+                print(f"Lỗi {source} {stock_code} (lần {attempt}): {e}")
+                # Driver có thể đã hỏng -> bỏ đi, lần sau tạo lại
+                if bot is not None:
+                    try:
+                        bot.quit()
+                    except Exception:
+                        pass
+                    bot = None
+                if attempt < self.max_retries:
+                    # Đưa lại vào hàng đợi sau retry_delay * attempt giây bằng Timer, worker tiếp tục xử lý
+                    # các mã khác trong lúc chờ. task_done của job cũ chỉ gọi sau khi job mới đã vào hàng đợi
+                    # để jobs.join() không kết thúc sớm.
+                    timer = threading.Timer(self.retry_delay * attempt, self._requeue,
+                                            args=((stock_code, source, attempt + 1),))
+                    timer.daemon = True
+                    timer.start()
+                    continue
+
+            with self._lock:
+                self.results[(stock_code, source)] = {'status': status, 'attempts': attempt, 'error': error}
+            self.jobs.task_done()
+
+        if bot is not None:
+            bot.quit()
+
+    def run(self):
+        """
+        Chạy toàn bộ job trong hàng đợi.
+
+        Returns:
+        --------
+        Dictionary {(mã, nguồn): {'status': 'ok'|'failed', 'attempts': số lần thử, 'error': thông báo lỗi}}
+        """
+        workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.num_workers)]
+        for worker in workers:
+            worker.start()
+
+        # Chờ hết job (kể cả các job thử lại) rồi mới cho worker dừng
+        self.jobs.join()
+        for _ in workers:
+            self.jobs.put(None)
+        for worker in workers:
+            worker.join()
+        return self.results
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.parent
+
+    # Chạy thử với các trang đã lưu trong data/ (không truy cập website thật)
+    server, base_url = serve_directory(script_dir / "data")
+    try:
+        scheduler = DownloadScheduler(
+            output_dir=os.path.join(script_dir, "data", "test_download"),
+            num_workers=2,
+            max_retries=2,
+            retry_delay=1,
+            url_templates={'LSGD': base_url + '/LSGD/{stock_code}/page_1.html',
+                           'BCTC': base_url + '/BCTC/{stock_code}/page_1.html'},
+        )
+        scheduler.add_jobs(['acb'])
+        print(scheduler.run())
+    finally:
+        server.shutdown()
@@ -3,23 +3,103 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver import Remote, ChromeOptions
 from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
 import pandas as pd
-import time
 from datetime import datetime
 import os
+import re
+import json
+import hashlib
+from PageArchive import PageArchive
+
+URL_CAFEF = 'https://cafef.vn/du-lieu/lich-su-giao-dich-{stock_code}-1.chn#data'
+URL_VIETSTOCK = 'https://finance.vietstock.vn/{stock_code}/financials.htm?tab=BCTT'
+
+# Ô ngày giao dịch trong bảng lịch sử giao dịch CafeF
+ROW_DATE_PATTERN = re.compile(r'<td[^>]*>\s*(\d{2}/\d{2}/\d{4})\s*</td>')
+# Manifest của mỗi mã: ngày giao dịch mới nhất đã lưu và mã băm bảng của từng trang
+MANIFEST_NAME = 'manifest.json'
+
+# Đường dẫn chromedriver chỉ cài/tra cứu một lần cho cả process
+_CHROMEDRIVER_PATH = None
+
+
+def get_chromedriver_path():
+    global _CHROMEDRIVER_PATH
+    if _CHROMEDRIVER_PATH is None:
+        _CHROMEDRIVER_PATH = ChromeDriverManager().install()
+    return _CHROMEDRIVER_PATH
+
+
+def load_manifest(ticker_dir):
+    path = os.path.join(ticker_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'latest_date': None, 'pages': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest.setdefault('latest_date', None)
+    manifest.setdefault('pages', {})
+    return manifest
+
+
+def save_manifest(ticker_dir, manifest):
+    # Ghi ra file tạm rồi đổi tên để manifest không bị hỏng nếu tiến trình dừng giữa chừng
+    path = os.path.join(ticker_dir, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def wait_for_reload(driver, locator, action, timeout=10):
+    """
+    Thực hiện action (chọn dropdown, bấm nút...) rồi chờ theo điều kiện thay vì time.sleep:
+    phần tử cũ bị thay (staleness) và phần tử mới xuất hiện.
+    Nếu action không làm trang tải lại (ví dụ chọn đúng giá trị đang chọn) thì chỉ chờ tối đa timeout.
+    """
+    wait = WebDriverWait(driver, timeout)
+    try:
+        old_element = driver.find_element(*locator)
+    except Exception:
+        old_element = None
+
+    action()
+
+    if old_element is not None:
+        try:
+            wait.until(EC.staleness_of(old_element))
+        except TimeoutException:
+            pass
+    return wait.until(EC.presence_of_element_located(locator))
+
+
+def select_and_wait(driver, locator, select, value, timeout=10):
+    """
+    Chọn value trong dropdown rồi chờ trang tải lại như wait_for_reload.
+    Nếu dropdown đã ở đúng giá trị thì trang không tải lại -> trả về ngay thay vì chờ hết timeout.
+    """
+    if select.first_selected_option.get_attribute('value') == value:
+        return WebDriverWait(driver, timeout).until(EC.presence_of_element_located(locator))
+    return wait_for_reload(driver, locator, lambda: select.select_by_value(value), timeout)
+
 
 class DownloadSourcePage:
-    def __init__(self):
-        self.driver = self.init_driver()
-    
-    def init_driver(self):
+    def __init__(self, driver=None, headless=False, timeout=10, compact=True):
+        self.headless = headless
+        self.timeout = timeout
+        # compact=True: chỉ lưu đoạn bảng cần thiết vào archive nén (PageArchive) thay vì toàn bộ page_source
+        self.compact = compact
+        self.driver = driver if driver is not None else self.init_driver(headless)
+
+    def init_driver(self, headless=False):
         options = ChromeOptions()
-        # options.add_argument("--headless=new")
+        if headless:
+            options.add_argument("--headless=new")
         options.add_argument("--disable-gpu")
         options.add_argument("--no-sandbox")
         options.add_argument("--disable-dev-shm-usage")
@@ -30,149 +110,192 @@ class DownloadSourcePage:
         options.add_argument("--blink-settings=imagesEnabled=false")
         options.add_argument("--disable-blink-features=AutomationControlled")
 
-        service = Service(ChromeDriverManager().install())
+        service = Service(get_chromedriver_path())
         return webdriver.Chrome(service=service, options=options)
 
+    def reset_driver(self):
+        """Khởi tạo lại driver (khi driver bị treo/crash)"""
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        self.driver = self.init_driver(self.headless)
+
+    def quit(self):
+        self.driver.quit()
+
     def download_source_summary(self, stock_code, url_vietstock, output_dir):
         """Lấy dữ liệu giao dịch từ trang web và gắn mã CK & tên công ty vào mỗi hàng."""
-        wait = WebDriverWait(self.driver, 3)
+        wait = WebDriverWait(self.driver, self.timeout)
+        # Bảng KQKD được render lại mỗi khi đổi kỳ / đơn vị hoặc chuyển trang
+        table_locator = (By.ID, 'tbl-data-BCTT-KQ')
         # url = f'https://finance.vietstock.vn/{stock_code}/financials.htm?tab=BCTT'
-        try:
-            self.driver.get(url_vietstock)
-            time.sleep(2)
+        self.driver.get(url_vietstock)
 
-            page = 1
-            select_element = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="finance-content"]/div/div/div[2]/div/div[2]/div[1]/div[1]/select[1]')))
-            # Tạo đối tượng Select
-            select = Select(select_element)
+        page = 1
+        select_element = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="finance-content"]/div/div/div[2]/div/div[2]/div[1]/div[1]/select[1]')))
+        # Tạo đối tượng Select
+        select = Select(select_element)
 
-            # Chọn option "4 Period" theo value
-            select.select_by_value("4")
-            time.sleep(2)
+        # Chọn option "4 Period" theo value
+        select_and_wait(self.driver, table_locator, select, "4", self.timeout)
 
-            dropdown = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="finance-content"]/div/div/div[2]/div/div[2]/div[1]/div[1]/select[2]')))
+        dropdown = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="finance-content"]/div/div/div[2]/div/div[2]/div[1]/div[1]/select[2]')))
 
-            select__ = Select(dropdown)
-            # Chọn "Year" theo giá trị (value)
-            select__.select_by_value("NAM")
-            time.sleep(2)
+        select__ = Select(dropdown)
+        # Chọn "Year" theo giá trị (value)
+        select_and_wait(self.driver, table_locator, select__, "NAM", self.timeout)
 
-            select_element = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="finance-content"]/div/div/div[2]/div/div[2]/div[1]/div[1]/select[3]')))
+        select_element = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="finance-content"]/div/div/div[2]/div/div[2]/div[1]/div[1]/select[3]')))
 
-            # Tạo đối tượng Select
-            select_ = Select(select_element)
+        # Tạo đối tượng Select
+        select_ = Select(select_element)
 
-            # Chọn "Million Dong" theo giá trị value (1000000)
-            select_.select_by_value("1000000")
-            time.sleep(2)
+        # Chọn "Million Dong" theo giá trị value (1000000)
+        select_and_wait(self.driver, table_locator, select_, "1000000", self.timeout)
 
-            output_path = os.path.join(output_dir, 'BCTC', stock_code)
-            os.makedirs(output_path, exist_ok=True)
+        output_path = os.path.join(output_dir, 'BCTC', stock_code)
+        os.makedirs(output_path, exist_ok=True)
+        archive = PageArchive(output_path, source='BCTC', compact=self.compact)
 
-            while True:
-                filename = filename = os.path.join(output_path, f"page_{page}.html")
-                with open(filename, "w", encoding="utf-8") as f:
-                    f.write(self.driver.page_source)
-                print(f"Đã lưu {filename}")
-                page += 1
-                try:
-                    # Chờ nút có thể nhấn được (tối đa 5 giây mỗi lần)
-                    btn = WebDriverWait(self.driver, 5).until(EC.element_to_be_clickable((By.XPATH, '//*[@id="finance-content"]/div/div/div[2]/div/div[1]/div[2]')))
-                    btn_class = btn.get_attribute("class")
+        while True:
+            filename = f"page_{page}.html"
+            archive.put(filename, self.driver.page_source, url=url_vietstock)
+            print(f"Đã lưu {filename}")
+            page += 1
+            try:
+                # Chờ nút có thể nhấn được (tối đa 5 giây mỗi lần)
+                btn = WebDriverWait(self.driver, 5).until(EC.element_to_be_clickable((By.XPATH, '//*[@id="finance-content"]/div/div/div[2]/div/div[1]/div[2]')))
+                btn_class = btn.get_attribute("class")
 
-                    if "disabled" in btn_class:
-                        break
-                    btn.click()
-                    time.sleep(3)
-                except:
-                    # Nếu nút không còn bấm được, thoát vòng lặp
+                if "disabled" in btn_class:
                     break
-                
-        finally:
-            self.driver.quit()
+                wait_for_reload(self.driver, table_locator, btn.click, self.timeout)
+            except Exception:
+                # Nếu nút không còn bấm được, thoát vòng lặp
+                break
+        archive.save()
 
-        
+    def download_source_trans_his(self, stock_code, url_cafef, output_dir, incremental=False, min_year=2025):
+        """
+        Lưu các trang lịch sử giao dịch CafeF vào output_dir/LSGD/<mã>/.
 
-    def download_source_trans_his(self, stock_code, url_cafef, output_dir):
-        wait = WebDriverWait(self.driver, 3)
-        try:
-            self.driver.get(url_cafef)
-            time.sleep(2)
-            page = 1
-            output_path = os.path.join(output_dir, 'LSGD', stock_code)
-            os.makedirs(output_path, exist_ok=True)
-            while True:
-                print(f"Trang {page}: đang tải...")
-                try:
-                    # Chờ bảng và lấy HTML
-                    table = wait.until(EC.presence_of_element_located((By.ID, "owner-contents-table")))
-
-                    # Lưu HTML vào file
-                    filename = os.path.join(output_path, f"page_{page}.html")
-                    with open(filename, "w", encoding="utf-8") as f:
-                        f.write(self.driver.page_source)
-                    print(f"Đã lưu {filename}")
-
-                    # Kiểm tra xem có dữ liệu < 2017 không
-                    rows = table.find_elements(By.TAG_NAME, "tr")
-                    stop = False
-
-                    for row in rows:
-                        cols = row.find_elements(By.TAG_NAME, "td")
-                        if cols:
-                            date_str = cols[0].text.strip()
-                            try:
-                                date_obj = datetime.strptime(date_str, "%d/%m/%Y")
-                                if date_obj.year < 2025:
-                                    print("Phát hiện dữ liệu cũ hơn 2017, dừng lại.")
-                                    stop = True
-                                    break
-                            except:
-                                continue
+        incremental=False: duyệt từ trang 1 đến khi gặp dữ liệu trước năm min_year, lưu page_N.html
+            (trang có nội dung bảng không đổi so với manifest thì không ghi lại).
+        incremental=True: chỉ lấy các phiên mới hơn mốc latest_date trong manifest, lưu thành
+            update_<ngày mới nhất>_<k>.html và dừng ngay khi gặp trang đã có hoặc không còn phiên mới.
+        Nếu việc duyệt dừng giữa chừng trước khi tới mốc cũ (lỗi chuyển trang / lỗi ở trang sau), manifest
+        và mốc không đổi và hàm báo lỗi để bộ lập lịch thử lại - tránh bỏ sót các phiên nằm giữa.
+        """
+        wait = WebDriverWait(self.driver, self.timeout)
+        output_path = os.path.join(output_dir, 'LSGD', stock_code)
+        os.makedirs(output_path, exist_ok=True)
 
-                    if stop:
-                        break
+        manifest = load_manifest(output_path)
+        archive = PageArchive(output_path, source='LSGD', compact=self.compact)
+        watermark = manifest.get('latest_date')
+        if incremental and watermark is None:
+            print(f"{stock_code}: chưa có manifest, tải toàn bộ.")
+            incremental = False
+        watermark = datetime.strptime(watermark, "%Y-%m-%d") if watermark else None
+        known_hashes = set(manifest['pages'].values())
 
-                    # Chuyển sang trang tiếp theo
-                    page += 1
-                    page_xpath = f"//div[contains(@class, 'pagination-item')]/p[@title='{page}']"
+        self.driver.get(url_cafef)
+        page = 1
+        new_pages = []
+        latest_date = watermark
+        # incremental: chỉ dời mốc khi đã duyệt tới các phiên cũ hơn hoặc bằng mốc cũ
+        reached_watermark = False
+        while True:
+            print(f"Trang {page}: đang tải...")
+            try:
+                # Chờ bảng và lấy HTML
+                table = wait.until(EC.presence_of_element_located((By.ID, "owner-contents-table")))
+                table_html = table.get_attribute("outerHTML")
+                page_hash = hashlib.sha1(table_html.encode("utf-8")).hexdigest()
+                dates = [datetime.strptime(d, "%d/%m/%Y") for d in ROW_DATE_PATTERN.findall(table_html)]
+                if dates:
+                    latest_date = max(latest_date or dates[0], max(dates))
 
-                    try:
-                        page_button = wait.until(EC.element_to_be_clickable((By.XPATH, page_xpath)))
-                        self.driver.execute_script("arguments[0].click();", page_button)
-                        wait.until(EC.staleness_of(page_button))  # Đợi trang mới tải
-                    except Exception as e:
-                        print(f"Lỗi khi chuyển sang trang {page}: {e}")
+                if incremental:
+                    # Trang đã lưu trước đó hoặc không có phiên mới -> không cần tải thêm
+                    if page_hash in known_hashes or not dates or max(dates) <= watermark:
+                        print(f"{stock_code}: không còn dữ liệu mới, dừng lại.")
+                        reached_watermark = True
                         break
+                    new_pages.append((self.driver.page_source, page_hash))
+                    stop = reached_watermark = min(dates) <= watermark
+                else:
+                    filename = f"page_{page}.html"
+                    if manifest['pages'].get(filename) == page_hash and archive.has(filename):
+                        print(f"Bỏ qua {filename} (không thay đổi)")
+                    else:
+                        archive.put(filename, self.driver.page_source, url=url_cafef)
+                        manifest['pages'][filename] = page_hash
+                        print(f"Đã lưu {filename}")
+
+                    # Kiểm tra xem có dữ liệu cũ hơn min_year không
+                    stop = any(d.year < min_year for d in dates)
+                    if stop:
+                        print(f"Phát hiện dữ liệu cũ hơn {min_year}, dừng lại.")
 
+                if stop:
+                    break
+
+                # Chuyển sang trang tiếp theo
+                page += 1
+                page_xpath = f"//div[contains(@class, 'pagination-item')]/p[@title='{page}']"
+
+                try:
+                    page_button = wait.until(EC.element_to_be_clickable((By.XPATH, page_xpath)))
+                    self.driver.execute_script("arguments[0].click();", page_button)
+                    wait.until(EC.staleness_of(page_button))  # Đợi trang mới tải
                 except Exception as e:
-                    print("Lỗi trong khi xử lý trang:", e)
+                    print(f"Lỗi khi chuyển sang trang {page}: {e}")
                     break
 
-        finally:
-            self.driver.quit()
+            except Exception as e:
+                # Lỗi ngay trang đầu -> báo lỗi để bộ lập lịch thử lại
+                if page == 1:
+                    raise
+                print("Lỗi trong khi xử lý trang:", e)
+                break
+
+        if incremental and not reached_watermark:
+            raise RuntimeError(f"{stock_code}: dừng ở trang {page} trước khi tới mốc "
+                               f"{watermark:%Y-%m-%d}, giữ nguyên manifest để tải lại")
+
+        if new_pages:
+            stamp = latest_date.strftime("%Y%m%d")
+            for k, (page_source, page_hash) in enumerate(new_pages, start=1):
+                filename = f"update_{stamp}_{k}.html"
+                archive.put(filename, page_source, url=url_cafef)
+                manifest['pages'][filename] = page_hash
+                print(f"Đã lưu {filename}")
+
+        if latest_date is not None:
+            manifest['latest_date'] = latest_date.strftime("%Y-%m-%d")
+        archive.save()
+        save_manifest(output_path, manifest)
 
     def download_stock_data_sequentially(self, stock_code, url_cafef, url_vietstock, output_dir):
         """Download lịch sử giao dịch trước, rồi đến báo cáo tài chính cho cùng 1 mã cổ phiếu."""
-        
+
         try:
             print(f"Download transaction history for {stock_code}...")
             self.download_source_trans_his(stock_code, url_cafef, output_dir)
 
-            # Cần reset driver vì 2 hàm đều gọi self.driver.quit()
-            self.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()))
-
             print(f"Download financial summary for {stock_code}...")
             self.download_source_summary(stock_code, url_vietstock, output_dir)
-        
+
         finally:
             self.driver.quit()
 
-    
+
 if __name__ == "__main__":
     bot = DownloadSourcePage()
     stock_code = 'acb'
-    url_cafef = f'https://cafef.vn/du-lieu/lich-su-giao-dich-{stock_code}-1.chn#data'
-    url_vietstock = f'https://finance.vietstock.vn/{stock_code}/financials.htm?tab=BCTT'
+    url_cafef = URL_CAFEF.format(stock_code=stock_code)
+    url_vietstock = URL_VIETSTOCK.format(stock_code=stock_code)
 
-    bot.download_stock_data_sequentially(stock_code, url_cafef, url_vietstock, '/home/hadoop/PORTFOLIO INVESTMENT/data')
+    bot.download_stock_data_sequentially(stock_code, url_cafef, url_vietstock, '/home/hadoop/PORTFOLIO INVESTMENT/data')
\ No newline at end of file
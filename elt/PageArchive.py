@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+
+ARCHIVE_NAME = 'pages.json.gz'
+
+# Các bảng cần giữ lại của từng nguồn (phần còn lại của page_source là script, quảng cáo...)
+FRAGMENT_TABLE_IDS = {
+    'LSGD': ['owner-contents-table'],
+    'BCTC': ['tbl-data-BCTT-KQ', 'tbl-data-BCTT-CD', 'tbl-data-BCTT-CSTC'],
+}
+
+
+def extract_fragment(page_html, table_ids):
+    """Cắt các thẻ <table id=...> cần thiết ra khỏi toàn bộ page_source"""
+    parts = []
+    for table_id in table_ids:
+        start = page_html.find(f'id="{table_id}"')
+        if start < 0:
+            continue
+        start = page_html.rfind('<table', 0, start)
+        end = page_html.find('</table>', start)
+        if start < 0 or end < 0:
+            continue
+        parts.append(page_html[start:end + len('</table>')])
+    return '\n'.join(parts)
+
+
+def page_sort_key(name):
+    """
+    Thứ tự đọc trang: update_<ngày>_<k> (mới nhất trước) rồi page_N theo số trang,
+    để khi trùng kỳ/ngày thì giữ số liệu tải gần nhất.
+    """
+    stem = Path(name).stem
+    match = re.fullmatch(r'update_(\d+)_(\d+)', stem)
+    if match:
+        return (0, -int(match.group(1)), int(match.group(2)))
+    match = re.search(r'page_(\d+)', stem)
+    return (1, int(match.group(1)) if match else 0, 0)
+
+
+class PageArchive:
+    """
+    Kho lưu trang thô của một mã (ví dụ data/LSGD/acb/):
+      - compact=True: chỉ giữ đoạn bảng cần thiết + metadata trong một file nén pages.json.gz,
+        các trang có cùng nội dung (cùng mã băm) chỉ lưu một lần
+      - compact=False: ghi nguyên page_source ra page_N.html như trước
+    read_pages() đọc cả hai dạng nên ParseSourcePage không cần biết trang được lưu thế nào.
+    """
+
+    def __init__(self, ticker_dir, source='LSGD', compact=True):
+        self.ticker_dir = Path(ticker_dir)
+        self.source = source
+        self.compact = compact
+        self.path = self.ticker_dir / ARCHIVE_NAME
+        self.pages = {}
+        self.fragments = {}
+        if self.path.exists():
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+            self.pages = data['pages']
+            self.fragments = data['fragments']
+
+    def has(self, name):
+        return name in self.pages or (self.ticker_dir / name).exists()
+
+    def put(self, name, page_html, **metadata):
+        """Lưu một trang; trả về mã băm nội dung đã lưu"""
+        if not self.compact:
+            os.makedirs(self.ticker_dir, exist_ok=True)
+            with open(self.ticker_dir / name, 'w', encoding='utf-8') as f:
+                f.write(page_html)
+            return hashlib.sha1(page_html.encode('utf-8')).hexdigest()
+
+        fragment = extract_fragment(page_html, FRAGMENT_TABLE_IDS[self.source])
+        # Không tìm thấy bảng (trang lỗi / đổi giao diện) -> giữ nguyên trang để không mất dữ liệu
+        if not fragment:
+            fragment = page_html
+        content_hash = hashlib.sha1(fragment.encode('utf-8')).hexdigest()
+        self.fragments.setdefault(content_hash, fragment)
+        self.pages[name] = {'hash': content_hash, 'saved_at': datetime.now().isoformat(timespec='seconds'), **metadata}
+        return content_hash
+
+    def save(self):
+        """Ghi archive xuống đĩa (bỏ các đoạn bảng không còn trang nào tham chiếu)"""
+        if not self.compact or not self.pages:
+            return
+        used = {page['hash'] for page in self.pages.values()}
+        self.fragments = {h: fragment for h, fragment in self.fragments.items() if h in used}
+
+        os.makedirs(self.ticker_dir, exist_ok=True)
+        tmp_path = self.path.with_name(ARCHIVE_NAME + '.tmp')
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump({'pages': self.pages, 'fragments': self.fragments}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def read_pages(self):
+        """Trả về list (tên trang, html) theo page_sort_key; trang trong archive được ưu tiên hơn file .html cùng tên"""
+        pages = {name: self.fragments[page['hash']] for name, page in self.pages.items()}
+        for path in self.ticker_dir.glob('*.html'):
+            if path.name not in pages:
+                with open(path, 'r', encoding='utf-8') as f:
+                    pages[path.name] = f.read()
+        return [(name, pages[name]) for name in sorted(pages, key=page_sort_key)]
+
+
+def compact_tree(root_dir, source='LSGD', remove_html=False):
+    """Chuyển các page_N.html đã tải trước đây của mọi mã trong root_dir sang archive nén"""
+    for ticker_dir in sorted(d for d in Path(root_dir).iterdir() if d.is_dir()):
+        archive = PageArchive(ticker_dir, source=source)
+        html_files = sorted(ticker_dir.glob('*.html'), key=lambda p: page_sort_key(p.name))
+        for path in html_files:
+            with open(path, 'r', encoding='utf-8') as f:
+                archive.put(path.name, f.read())
+        archive.save()
+        if remove_html:
+            for path in html_files:
+                path.unlink()
+        print(f"{ticker_dir.name}: {len(html_files)} trang -> {archive.path}")
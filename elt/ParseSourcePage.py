@@ -1,22 +1,213 @@
 import asyncio
-from bs4 import BeautifulSoup
-from crawl4ai import AsyncWebCrawler
-from crawl4ai.async_configs import CrawlerRunConfig, CacheMode
+from concurrent.futures import ProcessPoolExecutor
+from lxml import html as lxml_html
 import pandas as pd
 from pathlib import Path
+from PageArchive import PageArchive
+
+# Các cột của bảng lịch sử giao dịch CafeF (tbody#render-table-owner)
+LSGD_COLUMNS = ['transaction_date', 'closing_price', 'adjusted_price', 'change',
+                'matched_volume', 'matched_value', 'negotiated_volume', 'negotiated_value',
+                'opening_price', 'highest_price', 'lowest_price']
+LSGD_NUMERIC_COLUMNS = ['closing_price', 'adjusted_price', 'matched_volume', 'matched_value',
+                        'negotiated_volume', 'negotiated_value',
+                        'opening_price', 'highest_price', 'lowest_price']
+
+
+def extract_lsgd_rows(page_html):
+    """
+    Lấy các hàng của tbody#render-table-owner mà không cần trình duyệt:
+    cắt đúng đoạn <tbody>...</tbody> ra khỏi trang rồi mới parse bằng lxml.
+    """
+    start = page_html.find('id="render-table-owner"')
+    if start < 0:
+        return []
+    start = page_html.rfind('<tbody', 0, start)
+    end = page_html.find('</tbody>', start)
+    if start < 0 or end < 0:
+        return []
+
+    tbody = lxml_html.fragment_fromstring(page_html[start:end + len('</tbody>')])
+    rows = []
+    for tr in tbody.iterfind('tr'):
+        cols = [td.text_content().strip() for td in tr.iterfind('td')]
+        if len(cols) == 11:
+            rows.append(cols)
+    return rows
+
+
+def lsgd_rows_to_frame(rows, stock_code=None):
+    """Chuyển các hàng dạng chuỗi thành bảng có kiểu dữ liệu (ngày, số thực)"""
+    df = pd.DataFrame(rows, columns=LSGD_COLUMNS)
+    df['transaction_date'] = pd.to_datetime(df['transaction_date'], format='%d/%m/%Y', errors='coerce')
+
+    for col in LSGD_NUMERIC_COLUMNS:
+        df[col] = pd.to_numeric(df[col].str.replace(',', '', regex=False), errors='coerce')
+
+    # Thay đổi dạng "-0.1(-0.47 %)" -> change = -0.1, percent = -0.47
+    change = df['change'].str.extract(r'([-\d.]+)\s*\(([-\d.]+)\s*%\)')
+    df['change'] = pd.to_numeric(change[0], errors='coerce')
+    df['percent'] = pd.to_numeric(change[1], errors='coerce')
+
+    if stock_code is not None:
+        df.insert(0, 'stock_code', stock_code.upper())
+
+    df = (df.dropna(subset=['transaction_date'])
+            .drop_duplicates(subset=['transaction_date'], keep='first')
+            .sort_values('transaction_date')
+            .reset_index(drop=True))
+    return df
+
+
+def parse_lsgd_ticker_dir(ticker_dir):
+    """
+    Đọc tất cả các trang đã lưu của một mã (archive nén và/hoặc file .html, trang cập nhật
+    mới nhất trước) và trả về một bảng duy nhất
+    """
+    ticker_dir = Path(ticker_dir)
+    rows = []
+    for _, page_html in PageArchive(ticker_dir, source='LSGD').read_pages():
+        rows.extend(extract_lsgd_rows(page_html))
+    return lsgd_rows_to_frame(rows, stock_code=ticker_dir.name)
+
+
+# Các bảng báo cáo tài chính trên trang Vietstock (table#tbl-data-BCTT-<mã bảng>)
+BCTC_STATEMENTS = {'KQ': 'Kết quả kinh doanh', 'CD': 'Cân đối kế toán', 'CSTC': 'Chỉ số tài chính'}
+BCTC_COLUMNS = ['stock_code', 'statement', 'item', 'unit', 'period', 'value']
+
+
+def extract_bctc_rows(page_html):
+    """
+    Lấy các dòng số liệu của các bảng BCTC (4 kỳ / năm / triệu VNĐ) trong một trang đã lưu.
+    Bỏ qua các dòng thông tin (giai đoạn, hợp nhất, kiểm toán...) và dòng không có số liệu.
+    Trả về list các tuple (statement, item, unit, period, value chuỗi).
+    """
+    rows = []
+    for statement in BCTC_STATEMENTS:
+        start = page_html.find(f'id="tbl-data-BCTT-{statement}"')
+        if start < 0:
+            continue
+        start = page_html.rfind('<table', 0, start)
+        end = page_html.find('</table>', start)
+        table = lxml_html.fragment_fromstring(page_html[start:end + len('</table>')])
+
+        trs = table.xpath('.//tr')
+        if not trs:
+            continue
+        # Dòng tiêu đề: 4 cột đầu là tên chỉ tiêu, các cột sau là kỳ báo cáo
+        periods = [th.text_content().strip() for th in trs[0].xpath('./th|./td')][4:]
+
+        for tr in trs[1:]:
+            tds = tr.xpath('./td')
+            if len(tds) < 4 + len(periods):
+                continue
+            values = tds[4:4 + len(periods)]
+            if 'text-right' not in (values[0].get('class') or ''):
+                continue
+            item = tds[0].text_content().strip()
+            unit = tds[2].text_content().strip()
+            for period, td in zip(periods, values):
+                value = td.text_content().strip()
+                if item and value:
+                    rows.append((statement, item, unit, period, value))
+    return rows
+
+
+def parse_bctc_ticker_dir(ticker_dir):
+    """
+    Đọc tất cả page_N.html BCTC của một mã thành bảng dạng dài
+    (stock_code, statement, item, unit, period, value).
+    Các trang liền kề có thể trùng kỳ -> giữ số liệu của trang mới hơn (số trang nhỏ hơn).
+    """
+    ticker_dir = Path(ticker_dir)
+    rows = []
+    for _, page_html in PageArchive(ticker_dir, source='BCTC').read_pages():
+        rows.extend(extract_bctc_rows(page_html))
+
+    df = pd.DataFrame(rows, columns=BCTC_COLUMNS[1:])
+    df.insert(0, 'stock_code', ticker_dir.name.upper())
+    df['value'] = pd.to_numeric(df['value'].str.replace(',', '', regex=False), errors='coerce')
+    df = (df.dropna(subset=['value'])
+            .drop_duplicates(subset=['statement', 'item', 'period'], keep='first')
+            .sort_values(['statement', 'period'], kind='stable')
+            .reset_index(drop=True))
+    return df
+
+
+def _map_ticker_dirs(root, fn, stock_codes=None, max_workers=None):
+    """
+    Áp dụng fn cho từng thư mục con theo mã của root (chỉ các mã trong stock_codes nếu có),
+    mỗi mã trong một process (tuần tự khi max_workers=1 hoặc chỉ có một mã).
+    Trả về (danh sách thư mục đã sắp xếp, danh sách kết quả tương ứng).
+    """
+    ticker_dirs = sorted(d for d in Path(root).iterdir() if d.is_dir())
+    if stock_codes is not None:
+        wanted = {code.lower() for code in stock_codes}
+        ticker_dirs = [d for d in ticker_dirs if d.name.lower() in wanted]
+
+    if max_workers == 1 or len(ticker_dirs) <= 1:
+        return ticker_dirs, [fn(d) for d in ticker_dirs]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return ticker_dirs, list(executor.map(fn, ticker_dirs))
+
 
 class ParseSourcePage:
     def __init__(self):
         pass
 
+    def parse_local_file(self, local_file_path):
+        """Parse một trang lịch sử giao dịch đã lưu (không khởi động trình duyệt)"""
+        with open(local_file_path, 'r', encoding='utf-8') as f:
+            rows = extract_lsgd_rows(f.read())
+        return lsgd_rows_to_frame(rows)
+
+    def parse_lsgd_tree(self, lsgd_dir, stock_codes=None, max_workers=None):
+        """
+        Parse toàn bộ cây data/LSGD/<mã>/page_N.html, mỗi mã xử lý trong một process.
+
+        Parameters:
+        -----------
+        lsgd_dir : str
+            Thư mục gốc chứa các thư mục con theo mã cổ phiếu
+        stock_codes : list
+            Chỉ parse các mã này (mặc định: tất cả)
+        max_workers : int
+            Số process tối đa (mặc định: số CPU)
+
+        Returns:
+        --------
+        Dictionary {mã: DataFrame}
+        """
+        ticker_dirs, frames = _map_ticker_dirs(lsgd_dir, parse_lsgd_ticker_dir, stock_codes, max_workers)
+        return {d.name.upper(): frame for d, frame in zip(ticker_dirs, frames)}
+
+    def parse_bctc_tree(self, bctc_dir, stock_codes=None, max_workers=None):
+        """
+        Parse toàn bộ cây data/BCTC/<mã>/page_N.html (trang Vietstock đã lưu bởi
+        DownloadSourcePage.download_source_summary), mỗi mã xử lý trong một process.
+
+        Returns:
+        --------
+        DataFrame dạng dài (stock_code, statement, item, unit, period, value) cho tất cả các mã
+        """
+        _, frames = _map_ticker_dirs(bctc_dir, parse_bctc_ticker_dir, stock_codes, max_workers)
+        if not frames:
+            return pd.DataFrame(columns=BCTC_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
     async def crawl_local_file(self, local_file_path):
+        # bs4 / crawl4ai (trình duyệt) chỉ cần cho cách parse cũ qua crawler -> import khi dùng,
+        # để parse_local_file / parse_lsgd_tree (lxml) chạy được khi không cài các thư viện này
+        from bs4 import BeautifulSoup
+        from crawl4ai import AsyncWebCrawler
+        from crawl4ai.async_configs import CrawlerRunConfig, CacheMode
+
         file_url = f"file://{local_file_path}"
         config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS)
 
         async with AsyncWebCrawler() as crawler:
             result = await crawler.arun(url=file_url, config=config)
             if result.success:
-                print(1)
                 soup = BeautifulSoup(result.html, "html.parser")
                 # Tìm tất cả các hàng trong tbody
                 rows = soup.select('tbody#render-table-owner tr')
@@ -50,6 +241,10 @@ class ParseSourcePage:
 
 
 async def crawl_local_file(local_file_path):
+    from bs4 import BeautifulSoup
+    from crawl4ai import AsyncWebCrawler
+    from crawl4ai.async_configs import CrawlerRunConfig, CacheMode
+
     config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, capture_console_messages=True)
     
     async with AsyncWebCrawler() as crawler:
@@ -85,6 +280,11 @@ async def crawl_local_file(local_file_path):
 
 if __name__ == "__main__":
     script_dir = Path(__file__).parent.parent
-    html_file_path = script_dir / "data/page_2.html"
-    local_file_path =  f"file://{html_file_path.resolve()}" 
-    asyncio.run(crawl_local_file(local_file_path))
\ No newline at end of file
+    parser = ParseSourcePage()
+    tables = parser.parse_lsgd_tree(script_dir / "data/LSGD")
+    for stock_code, df in tables.items():
+        print(stock_code, df.shape)
+        print(df.head())
+
+    fundamentals = parser.parse_bctc_tree(script_dir / "data/BCTC")
+    print(fundamentals.head())
\ No newline at end of file
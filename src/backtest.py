@@ -0,0 +1,216 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from optim_funtions import calculate_returns_risk, mvo_optimization
+
+
+class RollingMoments:
+    """
+    Trung bình và hiệp phương sai của cửa sổ trượt window quan sát, cập nhật tăng dần: mỗi quan sát mới
+    cộng thêm x và x x' vào tổng, quan sát cũ nhất rời cửa sổ bị trừ đi (O(n^2) mỗi bước thay vì tính lại
+    np.cov trên cả cửa sổ). Giá trị thiếu (NaN) được tính là 0 và không được đếm vào valid_count;
+    cứ refresh bước thì tính lại tổng từ bộ đệm để sai số cộng dồn không tích lũy.
+    """
+
+    def __init__(self, n_assets, window, refresh=None):
+        self.window = window
+        self.refresh = refresh or 10 * window
+        self.buffer = np.zeros((window, n_assets))
+        self.valid_buffer = np.zeros((window, n_assets), dtype=bool)
+        self.sum = np.zeros(n_assets)
+        self.cross = np.zeros((n_assets, n_assets))
+        self.valid_count = np.zeros(n_assets, dtype=int)
+        self.count = 0
+        self.pos = 0
+        self.steps = 0
+
+    def push(self, x):
+        x = np.asarray(x, dtype=float)
+        valid = np.isfinite(x)
+        x = np.where(valid, x, 0.0)
+
+        if self.count == self.window:
+            old = self.buffer[self.pos]
+            self.sum -= old
+            self.cross -= np.outer(old, old)
+            self.valid_count -= self.valid_buffer[self.pos]
+        else:
+            self.count += 1
+
+        self.buffer[self.pos] = x
+        self.valid_buffer[self.pos] = valid
+        self.sum += x
+        self.cross += np.outer(x, x)
+        self.valid_count += valid
+        self.pos = (self.pos + 1) % self.window
+
+        self.steps += 1
+        if self.steps % self.refresh == 0:
+            data = self.buffer[:self.count]
+            self.sum = data.sum(axis=0)
+            self.cross = data.T @ data
+
+    def full(self):
+        """Các tài sản có đủ window quan sát hợp lệ"""
+        return self.valid_count == self.window
+
+    def mean(self, assets=None):
+        m = self.sum / self.count
+        return m if assets is None else m[assets]
+
+    def cov(self, assets=None, shrinkage=0.0):
+        """
+        Hiệp phương sai mẫu (chia count - 1, như np.cov), co rút về μ I: (1 - δ) S + δ μ I.
+        shrinkage='auto': δ theo Ledoit-Wolf (như shrinkage_covariance) tính từ bộ đệm của cửa sổ.
+        Khi số mã lớn hơn window, S suy biến và bài toán max Sharpe gần như không bị chặn
+        (có danh mục rủi ro ~ 0), nên cần co rút.
+        """
+        if assets is None:
+            assets = np.arange(len(self.sum))
+        m = self.mean(assets)
+        cross = self.cross[np.ix_(assets, assets)]
+        cov = (cross - self.count * np.outer(m, m)) / (self.count - 1)
+        if shrinkage == 'auto':
+            shrinkage = self._ledoit_wolf(assets, cov)
+        if shrinkage:
+            mu = np.trace(cov) / len(assets)
+            cov = (1 - shrinkage) * cov
+            cov[np.diag_indices_from(cov)] += shrinkage * mu
+        return cov
+
+    def _ledoit_wolf(self, assets, cov):
+        X = self.buffer[:self.count, assets]
+        X = X - X.mean(axis=0)
+        T, n = X.shape
+        S = cov * (T - 1) / T
+        trace_S = np.trace(S)
+        frob_S = np.sum(S**2)
+        d2 = frob_S - trace_S**2 / n
+        # ||x_t x_t' - S||_F^2 = ||x_t||^4 - 2 x_t' S x_t + ||S||_F^2
+        b2 = np.sum(np.sum(X**2, axis=1)**2 - 2 * np.sum((X @ S) * X, axis=1) + frob_S) / T**2
+        return min(b2, d2) / d2 if d2 > 0 else 1.0
+
+
+def _mvo_step(expected_returns, cov_matrix, previous_weights, risk_free_rate=0.02/52, max_weight=0.4,
+              alpha=0.1, solver='auto'):
+    return mvo_optimization(expected_returns, cov_matrix, risk_free_rate=risk_free_rate, max_weight=max_weight,
+                            alpha=alpha, solver=solver, initial_weights=previous_weights)
+
+
+def _equal_step(expected_returns, cov_matrix, previous_weights, **kwargs):
+    return np.full(len(expected_returns), 1 / len(expected_returns))
+
+
+OPTIMIZERS = {
+    'mvo': _mvo_step,
+    'equal': _equal_step,
+}
+
+
+def walk_forward_backtest(prices, window=52, rebalance_every=4, optimizer='mvo', cost_rate=0.001,
+                          risk_free_rate=0.02/52, max_weight=0.4, alpha=0.1, solver='pgd', signal=None,
+                          min_assets=None, shrinkage='auto'):
+    """
+    Backtest tái cân bằng theo cửa sổ trượt trên toàn bộ lịch sử giá.
+    Ở mỗi ngày tái cân bằng, lợi nhuận kỳ vọng / hiệp phương sai của window kỳ gần nhất (RollingMoments)
+    được đưa vào bộ tối ưu, khởi tạo từ trọng số hiện tại (đã trôi theo giá) của danh mục.
+    Giữa hai lần tái cân bằng trọng số trôi theo lợi nhuận của từng mã; chi phí giao dịch = cost_rate * turnover.
+
+    Parameters:
+    -----------
+    prices : pandas DataFrame
+        Ma trận giá (ngày x mã), ví dụ pivot_market(df)['closing_price'].resample('W').last()
+    window : int
+        Số kỳ dùng để ước lượng trung bình / hiệp phương sai
+    rebalance_every : int
+        Số kỳ giữa hai lần tái cân bằng
+    optimizer : str hoặc callable
+        'mvo' (mvo_optimization), 'equal' hoặc hàm f(expected_returns, cov_matrix, previous_weights, **kwargs) -> weights
+    cost_rate : float
+        Chi phí trên mỗi đơn vị giá trị giao dịch (0.001 = 0.1%)
+    solver : str
+        Bộ giải của mvo_optimization; mặc định 'pgd' (gradient giải tích, khởi tạo tốt từ trọng số kỳ trước)
+    signal : callable
+        f(date, codes, rolling_mean) -> lợi nhuận kỳ vọng (ví dụ từ mô hình dự báo); mặc định dùng trung bình trượt
+    min_assets : int
+        Số mã tối thiểu có đủ dữ liệu để tái cân bằng (mặc định ceil(1 / max_weight) - ít hơn thì không có
+        trọng số nào thỏa mãn giới hạn max_weight); các ngày có ít mã hơn được bỏ qua
+    shrinkage : 'auto', float hoặc 0
+        Hệ số co rút hiệp phương sai (RollingMoments.cov); 'auto': Ledoit-Wolf
+
+    Returns:
+    --------
+    Dictionary: value, returns (sau chi phí), gross_returns, turnover, costs (Series theo ngày),
+    weights (DataFrame ngày tái cân bằng x mã), stats (calculate_returns_risk trên giá trị danh mục)
+    """
+    step_fn = OPTIMIZERS[optimizer] if isinstance(optimizer, str) else optimizer
+    min_assets_feasible = math.ceil(1 / max_weight - 1e-9)
+    min_assets = min_assets_feasible if min_assets is None else max(min_assets, min_assets_feasible)
+    step_kwargs = dict(risk_free_rate=risk_free_rate, max_weight=max_weight, alpha=alpha, solver=solver)
+
+    price_values = prices.to_numpy(dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = price_values[1:] / price_values[:-1] - 1
+    returns[~np.isfinite(returns)] = np.nan
+    dates = prices.index[1:]
+    codes = prices.columns
+    n_periods, n_assets = returns.shape
+
+    moments = RollingMoments(n_assets, window)
+    weights = np.zeros(n_assets)
+    gross = np.zeros(n_periods)
+    turnover = np.zeros(n_periods)
+    costs = np.zeros(n_periods)
+    rebalance_rows, rebalance_weights = [], []
+    started = None
+
+    for t in range(n_periods):
+        r = np.nan_to_num(returns[t])
+        # Lợi nhuận kỳ t với trọng số đang nắm giữ, rồi trọng số trôi theo giá
+        gross[t] = weights @ r
+        if weights.any():
+            weights = weights * (1 + r) / (1 + gross[t])
+        moments.push(returns[t])
+
+        since_start = t - (window - 1)
+        if since_start < 0 or since_start % rebalance_every:
+            continue
+        eligible = np.flatnonzero(moments.full() & np.isfinite(price_values[t + 1]))
+        if len(eligible) < min_assets:
+            continue
+
+        expected = moments.mean(eligible)
+        if signal is not None:
+            expected = np.asarray(signal(dates[t], codes[eligible], expected), dtype=float)
+        previous = weights[eligible]
+        previous = previous / previous.sum() if previous.sum() > 0 else None
+        target = np.zeros(n_assets)
+        target[eligible] = step_fn(expected, moments.cov(eligible, shrinkage), previous, **step_kwargs)
+
+        turnover[t] = np.abs(target - weights).sum()
+        costs[t] = cost_rate * turnover[t]
+        weights = target
+        rebalance_rows.append(t)
+        rebalance_weights.append(target)
+        if started is None:
+            started = t
+
+    if started is None:
+        raise ValueError(f"Không đủ dữ liệu để tái cân bằng (cần {window} kỳ và ít nhất {min_assets} mã "
+                         f"với max_weight={max_weight})")
+
+    # Chuỗi kết quả tính từ lần tái cân bằng đầu tiên
+    net = (1 + gross) * (1 - costs) - 1
+    index = dates[started:]
+    value = pd.Series(np.cumprod(1 + net[started:]), index=index, name='value')
+    return {
+        'value': value,
+        'returns': pd.Series(net[started:], index=index, name='returns'),
+        'gross_returns': pd.Series(gross[started:], index=index, name='gross_returns'),
+        'turnover': pd.Series(turnover[started:], index=index, name='turnover'),
+        'costs': pd.Series(costs[started:], index=index, name='costs'),
+        'weights': pd.DataFrame(np.array(rebalance_weights), index=dates[rebalance_rows], columns=codes),
+        'stats': calculate_returns_risk(np.concatenate(([1.0], value.to_numpy()))),
+    }
@@ -0,0 +1,248 @@
+"""
+Benchmark các đường nóng: tối ưu danh mục (mvo_optimization, monte_carlo_simulation, calculate_returns_risk),
+parse trang đã lưu (ParseSourcePage trên data/LSGD/acb) và tính đặc trưng của read_data (features.py).
+Mỗi trường hợp ghi lại thời gian (tốt nhất trong repeat lần) và bộ nhớ đỉnh (tracemalloc), so với baseline
+đã lưu và trả về mã lỗi 1 nếu chậm hơn / tốn bộ nhớ hơn quá ngưỡng.
+
+    python benchmarks.py --save-baseline        # lưu baseline của máy hiện tại
+    python benchmarks.py                        # chạy và so với baseline
+    python benchmarks.py --quick --filter mvo   # chỉ các kích thước nhỏ, chỉ các trường hợp chứa 'mvo'
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from features import READ_DATA_SPEC, compute_features, load_features
+from optim_funtions import calculate_returns_risk, monte_carlo_simulation, mvo_optimization
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+LSGD_FIXTURE = ROOT_DIR / 'data' / 'LSGD' / 'acb'
+BASELINE_PATH = ROOT_DIR / 'data' / 'benchmarks' / 'baseline.json'
+
+# Số tài sản của bài toán tối ưu và kích thước thị trường (số mã, số phiên) của phần đặc trưng
+ASSET_COUNTS = (4, 50, 500, 2000)
+MARKET_SIZES = ((10, 1000), (100, 2500), (500, 2500))
+SERIES_LENGTHS = (1_000, 100_000, 1_000_000)
+
+# Ngưỡng chấp nhận so với baseline (thời gian dao động nhiều hơn bộ nhớ)
+TIME_TOLERANCE = 0.5
+MEMORY_TOLERANCE = 0.2
+# Chênh lệch tuyệt đối tối thiểu để tính là regression (các trường hợp dưới 1ms dao động rất mạnh)
+MIN_TIME_DELTA = 0.005
+MIN_MEMORY_DELTA_MB = 1.0
+
+
+def synthetic_market(n_tickers, n_days, n_factors=3, seed=0, start='2010-01-01'):
+    """
+    Lịch sử giao dịch giả lập dạng dài (stock_code, transaction_date, closing_price, matched_volume),
+    cùng định dạng với transaction_history: lợi nhuận theo mô hình nhân tố + nhiễu riêng, giá theo
+    chuyển động Brown hình học.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=n_days)
+    loadings = rng.normal(0, 1, size=(n_tickers, n_factors))
+    factors = rng.normal(0, 0.01, size=(n_days, n_factors))
+    returns = factors @ loadings.T + rng.normal(0, 0.015, size=(n_days, n_tickers))
+    prices = rng.uniform(5_000, 100_000, size=n_tickers) * np.exp(np.cumsum(returns, axis=0))
+    volumes = rng.lognormal(12, 1, size=(n_days, n_tickers)).round()
+
+    codes = np.array([f'T{i:04d}' for i in range(n_tickers)])
+    return pd.DataFrame({
+        'stock_code': np.repeat(codes, n_days),
+        'transaction_date': np.tile(dates.values, n_tickers),
+        'closing_price': prices.T.ravel().round(-1),
+        'matched_volume': volumes.T.ravel(),
+    })
+
+
+def synthetic_moments(n_assets, n_factors=5, seed=0):
+    """Lợi nhuận kỳ vọng và ma trận hiệp phương sai (nhân tố + đường chéo, luôn xác định dương) theo tuần"""
+    rng = np.random.default_rng(seed)
+    loadings = rng.normal(0, 0.02, size=(n_assets, n_factors))
+    specific_var = rng.uniform(0.0005, 0.002, size=n_assets)
+    cov_matrix = loadings @ loadings.T + np.diag(specific_var)
+    expected_returns = rng.normal(0.002, 0.004, size=n_assets)
+    return expected_returns, cov_matrix
+
+
+def measure(fn, repeat=3):
+    """
+    Thời gian (giây, tốt nhất trong repeat lần) và bộ nhớ đỉnh (MB, tracemalloc - gồm cả mảng numpy).
+    Một lần chạy khởi động (cache, import) không được tính; bộ nhớ được đo ở một lần chạy riêng
+    vì tracemalloc làm chậm code Python.
+    """
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'time': min(times), 'peak_mb': peak / 1024**2}
+
+
+def _sizes(sizes, quick):
+    # --quick bỏ kích thước lớn nhất của mỗi nhóm
+    return sizes[:-1] if quick else sizes
+
+
+def _optimization_cases(quick):
+    for n in _sizes(ASSET_COUNTS, quick):
+        mu, cov = synthetic_moments(n)
+        if n <= 200:
+            yield f'mvo_slsqp[{n}]', lambda mu=mu, cov=cov: mvo_optimization(mu, cov, solver='slsqp')
+        yield f'mvo_pgd[{n}]', lambda mu=mu, cov=cov: mvo_optimization(mu, cov, solver='pgd')
+        yield (f'monte_carlo[{n}]',
+               lambda mu=mu, cov=cov: monte_carlo_simulation(mu, cov, num_simulations=20_000, rng=0))
+
+    for length in _sizes(SERIES_LENGTHS, quick):
+        rng = np.random.default_rng(length)
+        prices = 10_000 * np.exp(np.cumsum(rng.normal(0, 0.01, size=length)))
+        yield f'returns_risk[{length}]', lambda prices=prices: calculate_returns_risk(prices)
+
+
+def _feature_cases(quick, cache_root):
+    for n_tickers, n_days in _sizes(MARKET_SIZES, quick):
+        market = synthetic_market(n_tickers, n_days)
+        size = f'{n_tickers}x{n_days}'
+        yield f'features[{size}]', lambda market=market: compute_features(market, READ_DATA_SPEC)
+
+        # read_data với cache đã có: băm dữ liệu từng mã + đọc Parquet (lần gọi đầu tiên của measure tạo cache)
+        cache_dir = os.path.join(cache_root, size)
+        yield (f'features_cached[{size}]',
+               lambda market=market, cache_dir=cache_dir: load_features(market, READ_DATA_SPEC, cache_dir=cache_dir))
+
+
+def _parsing_cases():
+    if not LSGD_FIXTURE.is_dir():
+        print(f"Bỏ qua benchmark parse: không có {LSGD_FIXTURE}")
+        return
+    sys.path.insert(0, str(ROOT_DIR / 'elt'))
+    try:
+        from ParseSourcePage import ParseSourcePage
+    except ImportError as e:
+        print(f"Bỏ qua benchmark parse: {e}")
+        return
+
+    parser = ParseSourcePage()
+    first_page = str(LSGD_FIXTURE / 'page_1.html')
+    yield 'parse_page[acb/page_1]', lambda: parser.parse_local_file(first_page)
+    yield ('parse_lsgd_tree[acb]',
+           lambda: parser.parse_lsgd_tree(LSGD_FIXTURE.parent, stock_codes=[LSGD_FIXTURE.name], max_workers=1))
+
+
+def run_benchmarks(quick=False, name_filter=None, repeat=3):
+    """
+    Chạy tất cả các trường hợp (có tên chứa name_filter nếu được chỉ định).
+
+    Returns:
+    --------
+    Dictionary {tên: {'time': giây, 'peak_mb': MB}}
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_root:
+        groups = [_optimization_cases(quick), _feature_cases(quick, cache_root), _parsing_cases()]
+        for group in groups:
+            for name, fn in group:
+                if name_filter and name_filter not in name:
+                    continue
+                results[name] = measure(fn, repeat=repeat)
+                print(f"{name:<32} {results[name]['time']:>10.4f}s {results[name]['peak_mb']:>10.1f} MB")
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def compare(results, baseline, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    """
+    Các trường hợp chậm hơn baseline quá time_tolerance hoặc tốn bộ nhớ hơn quá memory_tolerance (tỷ lệ).
+
+    Returns:
+    --------
+    List các chuỗi mô tả regression (rỗng nếu không có)
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        if result['time'] > max(base['time'] * (1 + time_tolerance), base['time'] + MIN_TIME_DELTA):
+            regressions.append(f"{name}: thời gian {result['time']:.4f}s so với baseline {base['time']:.4f}s")
+        if result['peak_mb'] > max(base['peak_mb'] * (1 + memory_tolerance), base['peak_mb'] + MIN_MEMORY_DELTA_MB):
+            regressions.append(f"{name}: bộ nhớ {result['peak_mb']:.1f} MB so với baseline {base['peak_mb']:.1f} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark tối ưu danh mục, parse trang và tính đặc trưng")
+    parser.add_argument('--quick', action='store_true', help="bỏ kích thước lớn nhất của mỗi nhóm")
+    parser.add_argument('--filter', default=None, help="chỉ chạy các trường hợp có tên chứa chuỗi này")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=str(BASELINE_PATH))
+    parser.add_argument('--save-baseline', action='store_true', help="ghi kết quả làm baseline mới")
+    parser.add_argument('--output', default=None, help="ghi kết quả lần chạy ra file JSON")
+    parser.add_argument('--time-tolerance', type=float, default=TIME_TOLERANCE)
+    parser.add_argument('--memory-tolerance', type=float, default=MEMORY_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(quick=args.quick, name_filter=args.filter, repeat=args.repeat)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+    if args.save_baseline:
+        # Giữ các trường hợp không chạy lần này (--quick / --filter) trong baseline cũ
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                results = {**json.load(f)['results'], **results}
+        save_baseline(results, args.baseline)
+        print(f"Đã lưu baseline: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Chưa có baseline ({args.baseline}), chạy với --save-baseline để tạo")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('environment') != environment():
+        print(f"Cảnh báo: baseline được tạo trên môi trường khác {baseline.get('environment')}")
+
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+# Dataset Parquet lịch sử giao dịch, chia thư mục theo mã: <root>/stock_code=ACB/part-0.parquet
+PARTITIONING = ds.partitioning(pa.schema([('stock_code', pa.string())]), flavor='hive')
+
+
+def _prepare_history(df):
+    """Chuẩn hóa kiểu dữ liệu trước khi ghi: ngày dạng datetime, sắp xếp theo (mã, ngày)"""
+    df = df.copy()
+    df['transaction_date'] = pd.to_datetime(df['transaction_date'])
+    df['stock_code'] = df['stock_code'].astype(str)
+    return df.sort_values(['stock_code', 'transaction_date'], kind='stable')
+
+
+def write_history_dataset(df, root_dir):
+    """
+    Ghi (hoặc cập nhật) lịch sử giao dịch vào dataset Parquet chia theo stock_code.
+    Chỉ các mã có trong df bị ghi đè, các mã khác trong dataset được giữ nguyên.
+    """
+    table = pa.Table.from_pandas(_prepare_history(df), preserve_index=False)
+    ds.write_dataset(table, root_dir, format='parquet', partitioning=PARTITIONING,
+                     existing_data_behavior='delete_matching')
+
+
+def csv_to_dataset(csv_path, root_dir, chunksize=500_000):
+    """
+    Chuyển file CSV đã xử lý (ví dụ transaction_history.csv) thành dataset Parquet,
+    đọc theo từng khối để không phải giữ toàn bộ CSV trong bộ nhớ.
+    """
+    if os.path.exists(root_dir):
+        shutil.rmtree(root_dir)
+
+    for i, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunksize)):
+        table = pa.Table.from_pandas(_prepare_history(chunk), preserve_index=False)
+        ds.write_dataset(table, root_dir, format='parquet', partitioning=PARTITIONING,
+                         basename_template=f'part-{i}-{{i}}.parquet',
+                         existing_data_behavior='overwrite_or_ignore')
+
+
+def load_history(root_dir, stock_codes=None, columns=None, start_time=None, end_time=None,
+                 memory_map=False):
+    """
+    Đọc lịch sử giao dịch từ dataset Parquet, chỉ đọc các mã / cột / khoảng thời gian cần thiết
+    (lọc theo thư mục stock_code và thống kê min/max của Parquet, không quét toàn bộ dữ liệu).
+
+    Parameters:
+    -----------
+    root_dir : str
+        Thư mục dataset (tạo bởi write_history_dataset / csv_to_dataset)
+    stock_codes : list
+        Danh sách mã cần đọc (mặc định: tất cả)
+    columns : list
+        Các cột cần đọc; 'stock_code' và 'transaction_date' luôn được đọc
+    start_time, end_time : str
+        Khoảng thời gian [start_time, end_time)
+    memory_map : bool
+        Đọc file qua memory map thay vì đọc vào bộ đệm
+
+    Returns:
+    --------
+    DataFrame dạng dài, sắp xếp theo (stock_code, transaction_date)
+    """
+    filesystem = fs.LocalFileSystem(use_mmap=memory_map)
+    dataset = ds.dataset(root_dir, format='parquet', partitioning=PARTITIONING, filesystem=filesystem)
+
+    conditions = []
+    if stock_codes is not None:
+        conditions.append(ds.field('stock_code').isin([str(code) for code in stock_codes]))
+    if start_time is not None:
+        conditions.append(ds.field('transaction_date') >= pd.Timestamp(start_time).to_pydatetime())
+    if end_time is not None:
+        conditions.append(ds.field('transaction_date') < pd.Timestamp(end_time).to_pydatetime())
+    condition = None
+    for expr in conditions:
+        condition = expr if condition is None else condition & expr
+
+    if columns is not None:
+        columns = ['stock_code', 'transaction_date'] + [c for c in columns if c not in ('stock_code', 'transaction_date')]
+
+    df = dataset.to_table(columns=columns, filter=condition).to_pandas()
+    return df.sort_values(['stock_code', 'transaction_date'], kind='stable').reset_index(drop=True)
+
+
+def load_history_dict(root_dir, stock_codes=None, columns=None, start_time=None, end_time=None,
+                      memory_map=False):
+    """Như load_history nhưng trả về dictionary {mã: DataFrame} (tách nhóm một lần)"""
+    df = load_history(root_dir, stock_codes, columns, start_time, end_time, memory_map)
+    return {code: group.reset_index(drop=True) for code, group in df.groupby('stock_code', sort=False)}
+
+
+def read_history_frame(path, stock_codes=None, columns=None, start_time=None, end_time=None):
+    """
+    Đọc lịch sử giao dịch dạng dài từ dataset Parquet (thư mục) hoặc từ file CSV cũ
+    (đọc một lần, parse ngày một lần), sắp xếp theo (stock_code, transaction_date).
+    """
+    if os.path.isdir(path):
+        return load_history(path, stock_codes, columns, start_time, end_time)
+
+    df = pd.read_csv(path)
+    if stock_codes is not None:
+        df = df[df['stock_code'].isin(stock_codes)].copy()
+    df['transaction_date'] = pd.to_datetime(df['transaction_date'])
+    if start_time is not None:
+        df = df[df['transaction_date'] >= start_time]
+    if end_time is not None:
+        df = df[df['transaction_date'] < end_time]
+    if columns is not None:
+        df = df[['stock_code', 'transaction_date'] + [c for c in columns if c not in ('stock_code', 'transaction_date')]]
+    return df.sort_values(['stock_code', 'transaction_date'], kind='stable').reset_index(drop=True)
+
+
+def read_history(path, stock_codes=None, columns=None, start_time=None, end_time=None):
+    """Như read_history_frame nhưng trả về dictionary {mã: DataFrame} (tách nhóm một lần)"""
+    df = read_history_frame(path, stock_codes, columns, start_time, end_time)
+    return {code: group.reset_index(drop=True) for code, group in df.groupby('stock_code', sort=False)}
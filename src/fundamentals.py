@@ -0,0 +1,196 @@
+import importlib.util
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Bảng cơ bản dạng dài (cùng cột với BCTC_COLUMNS của elt/ParseSourcePage, thêm file nguồn, năm và
+# thứ tự dòng trong khối - tên chỉ tiêu có thể lặp lại trong một báo cáo)
+FUNDAMENTAL_COLUMNS = ['file', 'stock_code', 'statement', 'line', 'item', 'unit', 'period', 'year', 'value']
+
+# Các sheet của file Excel Vietstock: dòng tiêu đề mỗi khối chứa title ở cột đầu, các cột giá trị
+# của dòng đó là nhãn kỳ ('Q1/2017', ...). CSTC có thêm cột đơn vị ngay sau tên chỉ tiêu.
+SHEETS = {
+    'CDKT': {'title': 'Cân đối kế toán', 'unit_column': False},
+    'KQKD': {'title': 'Kết quả kinh doanh', 'unit_column': False},
+    'CSTC': {'title': 'Chỉ số tài chính', 'unit_column': True},
+}
+
+# Các dòng thông tin của khối (không phải chỉ tiêu)
+SKIP_LABELS = ["Giai đoạn", "Hợp nhất", "Kiểm toán", "Công ty kiểm toán", "Ý kiến kiểm toán"]
+
+# python-calamine đọc xlsx nhanh hơn openpyxl nhiều lần; dùng nếu đã cài
+EXCEL_ENGINE = 'calamine' if importlib.util.find_spec('python_calamine') else None
+
+
+def stock_code_from_path(path):
+    """VietstockFinance_ACB_Bao-cao-tai-chinh_... .xlsx -> 'ACB'"""
+    return os.path.basename(path).split('_')[1]
+
+
+def parse_sheet(raw, statement, stock_code=None):
+    """
+    Chuyển một sheet (đọc với header=None) sang dạng dài bằng các phép toán vector:
+    dòng tiêu đề đánh dấu đầu khối, nhãn kỳ của từng cột được forward-fill xuống các dòng của khối
+    (thay cho vòng lặp iterrows gán năm), rồi mọi cột giá trị được trải thành (kỳ, giá trị).
+
+    Returns:
+    --------
+    DataFrame với các cột FUNDAMENTAL_COLUMNS (trừ 'file')
+    """
+    config = SHEETS[statement]
+    label = raw.iloc[:, 0]
+    unit = raw.iloc[:, 1] if config['unit_column'] else pd.Series('', index=raw.index)
+    values = raw.iloc[:, 2 if config['unit_column'] else 1:]
+
+    is_title = label.astype(str).str.contains(config['title'], regex=False).to_numpy()
+    # Nhãn kỳ / năm chỉ xử lý trên các dòng tiêu đề, rồi forward-fill theo khối: block[i] là khối của dòng i
+    headers = pd.Series(values[is_title].to_numpy(dtype=object).ravel(), dtype=object)
+    # Nhãn kỳ có thể được Excel lưu dạng số (2020 / 2020.0)
+    headers = headers.map(lambda x: str(int(x)) if isinstance(x, float) and x.is_integer() else x, na_action='ignore')
+    labels = headers.where(headers.isna(), headers.astype(str).str.strip())
+    years = pd.to_numeric(labels.str.extract(r'(\d{4})', expand=False), errors='coerce').to_numpy()
+    labels = labels.to_numpy().reshape(-1, values.shape[1])
+    years = years.reshape(-1, values.shape[1])
+    block = np.cumsum(is_title) - 1
+
+    # Thứ tự dòng trong khối = khoảng cách tới dòng tiêu đề gần nhất phía trên
+    position = np.arange(len(raw))
+    line = position - np.maximum.accumulate(np.where(is_title, position, 0))
+
+    keep = ~is_title & label.notna().to_numpy() & ~label.astype(str).str.strip().isin(SKIP_LABELS).to_numpy()
+    keep &= block >= 0
+    n_columns = values.shape[1]
+
+    period = labels[block[keep]].ravel()
+    # Cột không có nhãn kỳ (khối có ít hơn số cột) thì bỏ
+    has_period = pd.notna(period)
+    value = values.to_numpy()[keep].ravel()[has_period]
+    if value.dtype == object:
+        value = pd.Series(value).astype(str).str.replace(',', '', regex=False).str.strip()
+    long = pd.DataFrame({
+        'stock_code': stock_code,
+        'statement': statement,
+        'line': np.repeat(line[keep], n_columns)[has_period],
+        'item': np.repeat(label.astype(str).str.strip().to_numpy()[keep], n_columns)[has_period],
+        'unit': np.repeat(unit.fillna('').astype(str).str.strip().to_numpy()[keep], n_columns)[has_period],
+        'period': period[has_period],
+        'year': pd.array(years[block[keep]].ravel()[has_period], dtype='Int64'),
+        'value': pd.to_numeric(value, errors='coerce'),
+    })
+    return long[FUNDAMENTAL_COLUMNS[1:]]
+
+
+def read_workbook(path, sheets=('CDKT', 'KQKD', 'CSTC'), skiprows=5, skipfooter=12):
+    """
+    Mở file Excel một lần và đọc tất cả các sheet cần lấy (sheet không có trong file thì bỏ qua).
+
+    Returns:
+    --------
+    DataFrame dạng dài (FUNDAMENTAL_COLUMNS) của mọi sheet
+    """
+    stock_code = stock_code_from_path(path)
+    with pd.ExcelFile(path, engine=EXCEL_ENGINE) as workbook:
+        names = [sheet for sheet in sheets if sheet in workbook.sheet_names]
+        raw = workbook.parse(sheet_name=names, skiprows=skiprows, skipfooter=skipfooter, header=None)
+
+    parts = [parse_sheet(raw[sheet], sheet, stock_code) for sheet in names]
+    frame = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=FUNDAMENTAL_COLUMNS[1:])
+    frame.insert(0, 'file', os.path.basename(path))
+    return frame
+
+
+def _read_job(args):
+    path, sheets = args
+    try:
+        return read_workbook(path, sheets), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def load_fundamentals(file_list, sheets=('CDKT', 'KQKD', 'CSTC'), cache_path=None, max_workers=None):
+    """
+    Đọc nhiều file báo cáo tài chính song song (ProcessPoolExecutor, mỗi file chỉ mở một lần) thành
+    một bảng dạng dài. Với cache_path, bảng được lưu thành Parquet kèm manifest JSON (<cache_path>.json)
+    ghi kích thước / thời gian sửa của từng file: khi chạy lại chỉ các file mới hoặc đã thay đổi được đọc.
+
+    Parameters:
+    -----------
+    file_list : list
+        Danh sách đường dẫn file .xlsx
+    sheets : tuple
+        Các sheet cần đọc (khóa của SHEETS)
+    cache_path : str
+        File Parquet lưu bảng (None: không cache)
+    max_workers : int
+        Số tiến trình (1: đọc tuần tự)
+
+    Returns:
+    --------
+    DataFrame với các cột FUNDAMENTAL_COLUMNS, sắp xếp theo stock_code, statement, year
+    """
+    sheets = tuple(sheets)
+    signatures = {os.path.basename(path): _file_signature(path) for path in file_list}
+    meta_path = cache_path + '.json' if cache_path else None
+
+    cached, meta = None, {}
+    if cache_path and os.path.exists(cache_path) and os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if tuple(meta.get('sheets', ())) == sheets:
+            cached = pd.read_parquet(cache_path)
+        meta = meta.get('files', {}) if cached is not None else {}
+
+    pending = [path for path in file_list if meta.get(os.path.basename(path)) != signatures[os.path.basename(path)]]
+    parts = []
+    if cached is not None:
+        reuse = [name for name in signatures if name in meta and meta[name] == signatures[name]]
+        parts.append(cached[cached['file'].isin(reuse)])
+
+    if pending:
+        print(f"Đọc {len(pending)} file ({len(file_list) - len(pending)} file lấy từ cache)")
+        jobs = [(path, sheets) for path in pending]
+        if max_workers == 1 or len(jobs) == 1:
+            outputs = [_read_job(job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                outputs = list(executor.map(_read_job, jobs, chunksize=4))
+
+        for path, (frame, error) in zip(pending, outputs):
+            if error is not None:
+                print(f"Lỗi khi đọc {path}: {error}")
+                signatures.pop(os.path.basename(path))
+                continue
+            parts.append(frame)
+
+    parts = [part for part in parts if len(part)]
+    result = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=FUNDAMENTAL_COLUMNS)
+    result = result.sort_values(['stock_code', 'statement', 'year', 'line'], kind='stable').reset_index(drop=True)
+
+    if cache_path and pending:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        tmp_path = cache_path + '.tmp'
+        result.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'sheets': list(sheets), 'files': signatures}, f)
+    return result
+
+
+def statement_table(fundamentals, statement):
+    """
+    Bảng rộng của một báo cáo: mỗi dòng là một chỉ tiêu của một mã (stock_code, line, item, unit),
+    mỗi cột là một kỳ theo thứ tự thời gian (Q1/2017, Q2/2017, ...).
+    """
+    data = fundamentals[fundamentals['statement'] == statement]
+    periods = data[['year', 'period']].drop_duplicates().sort_values(['year', 'period'])['period'].unique()
+    table = data.pivot_table(index=['stock_code', 'line', 'item', 'unit'], columns='period', values='value',
+                             aggfunc='first')
+    return table.reindex(columns=periods).dropna(how='all').reset_index().rename_axis(columns=None)
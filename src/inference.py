@@ -0,0 +1,187 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from features import FeatureTracker
+
+
+def keras_predict_fn(model):
+    """Bọc mô hình Keras: một lần gọi cho cả batch (predict_on_batch không tạo lại pipeline dữ liệu)"""
+    def predict(x):
+        return np.asarray(model.predict_on_batch(x.astype(np.float32)))
+    return predict
+
+
+def torch_predict_fn(model, device='cpu'):
+    """Bọc mô hình PyTorch: chế độ eval, không tính gradient"""
+    import torch
+
+    model.eval()
+
+    def predict(x):
+        with torch.no_grad():
+            output = model(torch.as_tensor(x, dtype=torch.float32, device=device))
+        return output.detach().cpu().numpy()
+    return predict
+
+
+def _affine_params(scaler, n_features):
+    """
+    Đưa scaler về dạng scaled = x * scale + offset để chuẩn hóa cả batch (nhiều mã, mỗi mã
+    một scaler) bằng phép nhân mảng. Hỗ trợ MinMaxScaler và StandardScaler; scaler khác trả về None.
+    """
+    if hasattr(scaler, 'min_') and hasattr(scaler, 'scale_'):
+        return np.asarray(scaler.scale_, dtype=float), np.asarray(scaler.min_, dtype=float)
+    if hasattr(scaler, 'mean_') or hasattr(scaler, 'var_'):
+        mean = scaler.mean_ if getattr(scaler, 'mean_', None) is not None else np.zeros(n_features)
+        std = scaler.scale_ if getattr(scaler, 'scale_', None) is not None else np.ones(n_features)
+        return 1 / np.asarray(std, dtype=float), -np.asarray(mean, dtype=float) / np.asarray(std, dtype=float)
+    return None
+
+
+class _ScalerBank:
+    """Scaler của nhiều mã xếp thành mảng (B, F) để transform / inverse_transform cả batch"""
+
+    def __init__(self, scalers, n_features):
+        self.scalers = scalers
+        params = [_affine_params(scaler, n_features) for scaler in scalers]
+        self.affine = all(p is not None for p in params)
+        if self.affine:
+            self.scale = np.stack([np.broadcast_to(p[0], n_features) for p in params])
+            self.offset = np.stack([np.broadcast_to(p[1], n_features) for p in params])
+
+    def transform(self, x):
+        # x: (B, F)
+        if self.affine:
+            return x * self.scale + self.offset
+        return np.vstack([scaler.transform(row.reshape(1, -1)) for scaler, row in zip(self.scalers, x)])
+
+    def inverse_transform(self, y):
+        # y: (B, H) -> mỗi cột dùng chung scaler (một biến mục tiêu)
+        if self.affine:
+            return (y - self.offset[:, :1]) / self.scale[:, :1]
+        return np.vstack([scaler.inverse_transform(row.reshape(-1, 1)).ravel() for scaler, row in zip(self.scalers, y)])
+
+
+class BatchForecaster:
+    """
+    Dự báo nhiều mã cùng lúc: cửa sổ hiện tại của tất cả các mã được xếp thành một batch,
+    mỗi bước đệ quy chạy mô hình một lần cho cả batch. Mỗi mã giữ scaler_x / scaler_y riêng và
+    một FeatureTracker để tính đặc trưng của ngày dự báo.
+
+    predict_fn: hàm nhận mảng (batch, sequence_length, num_features) đã chuẩn hóa và trả về
+    (batch,) hoặc (batch, horizon) đã chuẩn hóa (xem keras_predict_fn, torch_predict_fn).
+    Mô hình riêng cho từng mã: truyền predict_fn khi add_ticker; các mã dùng chung một
+    predict_fn được gộp vào cùng một batch.
+    """
+
+    def __init__(self, predict_fn=None, batch_size=4096):
+        self.predict_fn = predict_fn
+        self.batch_size = batch_size
+        self.tickers = {}
+
+    def add_ticker(self, stock_code, last_sequence, history_prices, scaler_x, scaler_y,
+                   predict_fn=None, include_price=True):
+        """
+        Parameters:
+        -----------
+        last_sequence : array (sequence_length, num_features)
+            Cửa sổ đặc trưng cuối cùng đã chuẩn hóa bằng scaler_x
+        history_prices : list
+            Lịch sử giá đóng cửa (chưa chuẩn hóa) để khởi tạo FeatureTracker
+        include_price : bool
+            Đặc trưng có chứa closing_price ở cột đầu hay không (như compute_features của notebook)
+        """
+        predict_fn = predict_fn or self.predict_fn
+        if predict_fn is None:
+            raise ValueError(f"Chưa có predict_fn cho mã {stock_code}")
+        self.tickers[stock_code] = {
+            'sequence': np.asarray(last_sequence, dtype=float),
+            'history_prices': history_prices,
+            'scaler_x': scaler_x,
+            'scaler_y': scaler_y,
+            'predict_fn': predict_fn,
+            'include_price': include_price,
+        }
+
+    def _groups(self):
+        """Gộp các mã theo predict_fn (cùng một mô hình -> cùng một batch)"""
+        groups = {}
+        for stock_code, info in self.tickers.items():
+            groups.setdefault(id(info['predict_fn']), []).append(stock_code)
+        return groups.values()
+
+    def _predict(self, predict_fn, x):
+        outputs = [np.asarray(predict_fn(x[i:i + self.batch_size])) for i in range(0, len(x), self.batch_size)]
+        output = np.concatenate(outputs, axis=0)
+        return output.reshape(len(x), -1)
+
+    def forecast(self, n_days):
+        """
+        Dự báo đệ quy n_days ngày cho tất cả các mã.
+
+        Returns:
+        --------
+        Dictionary {mã: mảng n_days giá dự báo (chưa chuẩn hóa)}
+        """
+        results = {}
+        for codes in self._groups():
+            infos = [self.tickers[code] for code in codes]
+            predict_fn = infos[0]['predict_fn']
+            sequences = np.stack([info['sequence'] for info in infos])
+            n_features = sequences.shape[2]
+            x_bank = _ScalerBank([info['scaler_x'] for info in infos], n_features)
+            y_bank = _ScalerBank([info['scaler_y'] for info in infos], 1)
+            trackers = [FeatureTracker(info['history_prices'], include_price=info['include_price']) for info in infos]
+
+            predictions = np.empty((len(codes), n_days))
+            for day in range(n_days):
+                scaled = self._predict(predict_fn, sequences)[:, :1]
+                prices = y_bank.inverse_transform(scaled)[:, 0]
+                predictions[:, day] = prices
+
+                if day == n_days - 1:
+                    break
+                for tracker, price in zip(trackers, prices):
+                    tracker.update(price)
+                new_rows = x_bank.transform(np.array([tracker.features() for tracker in trackers], dtype=float))
+                sequences = np.concatenate([sequences[:, 1:], new_rows[:, None, :]], axis=1)
+
+            results.update(zip(codes, predictions))
+        return results
+
+    def forecast_direct(self, horizon=None):
+        """
+        Dự báo trực tiếp nhiều ngày: mô hình xuất cả horizon ngày trong một lần chạy
+        (huấn luyện với build_direct_sequences), không cần cập nhật đặc trưng đệ quy.
+
+        Returns:
+        --------
+        Dictionary {mã: mảng horizon giá dự báo (chưa chuẩn hóa)}
+        """
+        results = {}
+        for codes in self._groups():
+            infos = [self.tickers[code] for code in codes]
+            sequences = np.stack([info['sequence'] for info in infos])
+            scaled = self._predict(infos[0]['predict_fn'], sequences)
+            if horizon is not None:
+                scaled = scaled[:, :horizon]
+            y_bank = _ScalerBank([info['scaler_y'] for info in infos], 1)
+            results.update(zip(codes, y_bank.inverse_transform(scaled)))
+        return results
+
+
+def build_direct_sequences(X_scaled, y_scaled, sequence_length, horizon):
+    """
+    Tạo dữ liệu huấn luyện cho chế độ dự báo trực tiếp nhiều ngày:
+    X[i] = X_scaled[i : i + sequence_length], Y[i] = y_scaled[i + sequence_length : i + sequence_length + horizon].
+    Dùng sliding_window_view (không sao chép dữ liệu).
+    """
+    X_scaled = np.asarray(X_scaled)
+    y_scaled = np.asarray(y_scaled).reshape(-1)
+    n_samples = len(X_scaled) - sequence_length - horizon + 1
+    if n_samples <= 0:
+        raise ValueError("Không đủ dữ liệu cho sequence_length + horizon")
+
+    X = sliding_window_view(X_scaled, sequence_length, axis=0)[:n_samples].transpose(0, 2, 1)
+    Y = sliding_window_view(y_scaled[sequence_length:], horizon)[:n_samples]
+    return X, Y
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def data_hash(*objs):
+    """
+    Mã băm dữ liệu huấn luyện (DataFrame / Series / mảng numpy / giá trị khác), dùng làm một phần
+    khóa của ModelRegistry: dữ liệu của mã không đổi -> cùng mã băm -> dùng lại mô hình đã lưu.
+    """
+    h = hashlib.sha1()
+    for obj in objs:
+        if isinstance(obj, (pd.DataFrame, pd.Series)):
+            if isinstance(obj, pd.DataFrame):
+                h.update(repr(list(obj.columns)).encode())
+            h.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+        elif isinstance(obj, np.ndarray):
+            h.update(repr((obj.shape, obj.dtype.str)).encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+        else:
+            h.update(repr(obj).encode())
+    return h.hexdigest()
+
+
+def _params_json(params):
+    return json.dumps(params or {}, sort_keys=True, default=str)
+
+
+def _model_format(model):
+    """Định dạng lưu theo thư viện của mô hình (không import thư viện đó)"""
+    module = type(model).__module__
+    if module.startswith(('keras', 'tensorflow')):
+        return 'keras'
+    if any(cls.__module__.startswith('torch') for cls in type(model).__mro__):
+        return 'torch'
+    return 'pickle'
+
+
+class RegistryEntry:
+    """
+    Một mô hình đã lưu: meta (tham số, mã băm dữ liệu, ...) và state (scaler, trạng thái MSTL, ...) được đọc
+    ngay; mô hình chỉ được đọc từ đĩa khi truy cập thuộc tính model lần đầu.
+    """
+
+    def __init__(self, path, meta, state, build_fn=None, model=None):
+        self.path = path
+        self.meta = meta
+        self.state = state
+        self.build_fn = build_fn
+        self._model = model
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self._load_model()
+        return self._model
+
+    def _load_model(self):
+        fmt = self.meta['format']
+        if fmt == 'keras':
+            from tensorflow.keras.models import load_model
+            return load_model(os.path.join(self.path, 'model.keras'))
+        if fmt == 'torch':
+            import torch
+
+            if self.build_fn is None:
+                raise ValueError("Cần build_fn để tạo lại mô hình PyTorch trước khi nạp trọng số")
+            model = self.build_fn()
+            model.load_state_dict(torch.load(os.path.join(self.path, 'model.pt'), map_location='cpu'))
+            model.eval()
+            return model
+        with open(os.path.join(self.path, 'model.pkl'), 'rb') as f:
+            return pickle.load(f)
+
+
+class ModelRegistry:
+    """
+    Kho mô hình trên đĩa, khóa theo (mã, loại mô hình, tham số, mã băm dữ liệu train):
+    <root_dir>/<model_type>/<stock_code>/<khóa>/ gồm meta.json, state.pkl và file mô hình
+    (model.keras cho Keras, model.pt - state_dict cho PyTorch, model.pkl cho sklearn / XGBoost / dict các mô hình).
+    Chạy lại hằng ngày chỉ huấn luyện các mã có dữ liệu hoặc tham số thay đổi.
+    """
+
+    def __init__(self, root_dir, keep=1):
+        self.root_dir = root_dir
+        # Số phiên bản giữ lại cho mỗi (mã, loại mô hình); None: giữ tất cả
+        self.keep = keep
+
+    @staticmethod
+    def key(params, data_hash):
+        return hashlib.sha1((_params_json(params) + data_hash).encode()).hexdigest()[:16]
+
+    def _dir(self, stock_code, model_type, key=None):
+        path = os.path.join(self.root_dir, model_type, str(stock_code))
+        return os.path.join(path, key) if key else path
+
+    def exists(self, stock_code, model_type, params, data_hash):
+        path = self._dir(stock_code, model_type, self.key(params, data_hash))
+        return os.path.exists(os.path.join(path, 'meta.json'))
+
+    def get(self, stock_code, model_type, params, data_hash, build_fn=None):
+        """RegistryEntry nếu đã có mô hình với đúng tham số và dữ liệu, ngược lại None"""
+        path = self._dir(stock_code, model_type, self.key(params, data_hash))
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(os.path.join(path, 'state.pkl'), 'rb') as f:
+            state = pickle.load(f)
+        return RegistryEntry(path, meta, state, build_fn)
+
+    def save(self, stock_code, model_type, params, data_hash, model, state=None):
+        """
+        Lưu mô hình và state (ghi vào thư mục tạm rồi đổi tên). Các phiên bản cũ hơn của cùng
+        (mã, loại mô hình) vượt quá keep bị xóa.
+        """
+        key = self.key(params, data_hash)
+        path = self._dir(stock_code, model_type, key)
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        fmt = _model_format(model)
+        if fmt == 'keras':
+            model.save(os.path.join(tmp_path, 'model.keras'))
+        elif fmt == 'torch':
+            import torch
+            torch.save(model.state_dict(), os.path.join(tmp_path, 'model.pt'))
+        else:
+            with open(os.path.join(tmp_path, 'model.pkl'), 'wb') as f:
+                pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmp_path, 'state.pkl'), 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        meta = {
+            'stock_code': str(stock_code),
+            'model_type': model_type,
+            'params': json.loads(_params_json(params)),
+            'data_hash': data_hash,
+            'format': fmt,
+            'created': time.time(),
+        }
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        self._prune(stock_code, model_type, key)
+        return RegistryEntry(path, meta, state, model=model)
+
+    def _prune(self, stock_code, model_type, current_key):
+        if self.keep is None:
+            return
+        folder = self._dir(stock_code, model_type)
+        versions = [name for name in os.listdir(folder)
+                    if name != current_key and os.path.exists(os.path.join(folder, name, 'meta.json'))]
+        versions.sort(key=lambda name: os.path.getmtime(os.path.join(folder, name, 'meta.json')), reverse=True)
+        for name in versions[max(self.keep - 1, 0):]:
+            shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+
+    def get_or_train(self, stock_code, model_type, params, data_hash, train_fn, build_fn=None):
+        """
+        Dùng lại mô hình đã lưu nếu có, ngược lại gọi train_fn() -> (model, state), lưu lại rồi trả về.
+
+        Returns:
+        --------
+        (RegistryEntry, True nếu vừa huấn luyện)
+        """
+        entry = self.get(stock_code, model_type, params, data_hash, build_fn)
+        if entry is not None:
+            return entry, False
+        print(f"{stock_code}: huấn luyện {model_type} (chưa có mô hình cho dữ liệu / tham số hiện tại)")
+        model, state = train_fn()
+        return self.save(stock_code, model_type, params, data_hash, model, state), True
+
+    def stale(self, stock_codes, model_type, params, data_hashes):
+        """Các mã chưa có mô hình ứng với dữ liệu hiện tại (data_hashes: {mã: mã băm})"""
+        return [code for code in stock_codes
+                if not self.exists(code, model_type, params, data_hashes[code])]
@@ -41,20 +41,328 @@ def calculate_returns_risk(predictions, scaler=None):
         'max_drawdown': max_drawdown
     }
 
+# Tính toán các chỉ số theo luồng (cập nhật O(1) cho mỗi quan sát mới)
+class RiskAccumulator:
+    """
+    Bộ tích lũy các chỉ số của calculate_returns_risk cho nhiều mã cùng lúc,
+    cập nhật mỗi khi có giá mới thay vì tính lại trên toàn bộ chuỗi:
+      - Trung bình / độ lệch chuẩn lợi nhuận theo Welford
+      - Trung bình / độ lệch chuẩn của các lợi nhuận âm (downside) theo Welford
+      - Giá trị tích lũy, đỉnh và mức sụt giảm lớn nhất (max drawdown)
+    Trạng thái của mỗi mã được lưu trong các mảng numpy (mỗi mã 1 cột).
+    """
+    _FIELDS = ('last_price', 'count', 'mean', 'm2',
+               'down_count', 'down_mean', 'down_m2',
+               'cumulative', 'peak', 'max_drawdown')
+
+    def __init__(self, tickers=None, risk_free_rate=0.02/52, capacity=64):
+        self.risk_free_rate = risk_free_rate
+        self.tickers = []
+        self.index = {}
+        self._state = np.zeros((len(self._FIELDS), max(capacity, 1)))
+        self._state[self._FIELDS.index('last_price')] = np.nan
+        for ticker in tickers or []:
+            self.add_ticker(ticker)
+
+    def _field(self, name):
+        return self._state[self._FIELDS.index(name)]
+
+    def add_ticker(self, ticker):
+        """Thêm mã mới (nếu chưa có), trả về chỉ số cột của mã"""
+        if ticker in self.index:
+            return self.index[ticker]
+        i = len(self.tickers)
+        if i >= self._state.shape[1]:
+            # Nhân đôi dung lượng khi hết chỗ
+            grown = np.zeros((self._state.shape[0], 2 * self._state.shape[1]))
+            grown[self._FIELDS.index('last_price')] = np.nan
+            grown[:, :i] = self._state
+            self._state = grown
+        self.tickers.append(ticker)
+        self.index[ticker] = i
+        return i
+
+    def _update(self, idx, prices):
+        """Cập nhật đồng thời các mã tại chỉ số idx với giá mới prices"""
+        last_price = self._field('last_price')
+        previous = last_price[idx]
+        last_price[idx] = prices
+
+        # Giá đầu tiên của mỗi mã chỉ dùng làm mốc, chưa có lợi nhuận
+        has_return = ~np.isnan(previous)
+        idx, prices, previous = idx[has_return], prices[has_return], previous[has_return]
+        if len(idx) == 0:
+            return
+        returns = (prices - previous) / previous
+
+        # Welford cho trung bình và phương sai
+        count, mean, m2 = self._field('count'), self._field('mean'), self._field('m2')
+        count[idx] += 1
+        delta = returns - mean[idx]
+        mean[idx] += delta / count[idx]
+        m2[idx] += delta * (returns - mean[idx])
+
+        # Welford cho các lợi nhuận âm
+        negative = returns < 0
+        down_idx, down_returns = idx[negative], returns[negative]
+        down_count, down_mean, down_m2 = self._field('down_count'), self._field('down_mean'), self._field('down_m2')
+        down_count[down_idx] += 1
+        delta = down_returns - down_mean[down_idx]
+        down_mean[down_idx] += delta / down_count[down_idx]
+        down_m2[down_idx] += delta * (down_returns - down_mean[down_idx])
+
+        # Giá trị tích lũy, đỉnh và max drawdown
+        cumulative, peak, max_drawdown = self._field('cumulative'), self._field('peak'), self._field('max_drawdown')
+        first = count[idx] == 1
+        cumulative[idx] = np.where(first, 1 + returns, cumulative[idx] * (1 + returns))
+        peak[idx] = np.where(first, cumulative[idx], np.maximum(peak[idx], cumulative[idx]))
+        drawdown = cumulative[idx] / peak[idx] - 1
+        max_drawdown[idx] = np.where(first, drawdown, np.minimum(max_drawdown[idx], drawdown))
+
+    def update(self, ticker, price):
+        """Cập nhật 1 giá mới cho 1 mã"""
+        i = self.add_ticker(ticker)
+        self._update(np.array([i]), np.array([price], dtype=float))
+
+    def update_many(self, prices):
+        """
+        Cập nhật 1 phiên mới cho nhiều mã cùng lúc.
+          - prices: dict {mã: giá} hoặc mảng giá theo thứ tự self.tickers (NaN = không có giá mới)
+        """
+        if isinstance(prices, dict):
+            idx = np.array([self.add_ticker(ticker) for ticker in prices], dtype=int)
+            values = np.array(list(prices.values()), dtype=float)
+        else:
+            values = np.asarray(prices, dtype=float)
+            if values.shape != (len(self.tickers),):
+                raise ValueError(f"Mảng giá có kích thước {values.shape}, cần mảng 1 chiều {len(self.tickers)} "
+                                 f"phần tử theo thứ tự self.tickers")
+            idx = np.arange(len(values))
+        valid = ~np.isnan(values)
+        self._update(idx[valid], values[valid])
+
+    def snapshot(self, ticker):
+        """Trả về dict chỉ số của 1 mã, cùng các key với calculate_returns_risk"""
+        i = self.index[ticker]
+        count = self._field('count')[i]
+        if count == 0:
+            return {
+                'expected_return': np.nan,
+                'risk': np.nan,
+                'sharpe_ratio': 0,
+                'sortino_ratio': 0,
+                'max_drawdown': np.nan
+            }
+
+        expected_return = self._field('mean')[i]
+        risk = np.sqrt(self._field('m2')[i] / count)
+        sharpe_ratio = (expected_return - self.risk_free_rate) / risk if risk != 0 else 0
+
+        down_count = self._field('down_count')[i]
+        downside_risk = np.sqrt(self._field('down_m2')[i] / down_count) if down_count > 0 else 0
+        sortino_ratio = (expected_return - self.risk_free_rate) / downside_risk if downside_risk > 0 else 0
+
+        return {
+            'expected_return': expected_return,
+            'risk': risk,
+            'sharpe_ratio': sharpe_ratio,
+            'sortino_ratio': sortino_ratio,
+            'max_drawdown': self._field('max_drawdown')[i]
+        }
+
+    def snapshot_all(self):
+        """Trả về dict {mã: chỉ số} cho tất cả các mã"""
+        return {ticker: self.snapshot(ticker) for ticker in self.tickers}
+
+#-----------------------------------------------------------------------------------------------------------------------------------------
+# Ma trận hiệp phương sai dạng low-rank + đường chéo: Σ = L L' + diag(d)
+# Dùng cho danh mục lớn (~1.600 mã) để không phải tạo ma trận dày n x n
+def factor_covariance(factor_loadings, factor_cov, specific_var):
+    """
+    Hiệp phương sai theo mô hình nhân tố: Σ = B F B' + diag(specific_var)
+      - factor_loadings: B (n x k), factor_cov: F (k x k), specific_var: (n,)
+    Trả về dict {'loadings': L (n x k), 'diag': d} với L = B F^(1/2)
+    """
+    factor_loadings = np.asarray(factor_loadings, dtype=float)
+    eigvals, eigvecs = np.linalg.eigh(np.asarray(factor_cov, dtype=float))
+    factor_sqrt = eigvecs * np.sqrt(np.maximum(eigvals, 0))
+    return {
+        'loadings': factor_loadings @ factor_sqrt,
+        'diag': np.asarray(specific_var, dtype=float)
+    }
+
+def shrinkage_covariance(returns, shrinkage=None):
+    """
+    Hiệp phương sai co rút Ledoit-Wolf về ma trận đơn vị: Σ = (1 - δ) S + δ μ I
+      - returns: ma trận lợi nhuận (T quan sát x n mã)
+      - shrinkage: δ, nếu None thì ước lượng theo Ledoit-Wolf
+    Chỉ dùng ma trận Gram T x T nên không tạo ma trận n x n.
+    Trả về dict {'loadings': L (n x T), 'diag': d}
+    """
+    X = np.asarray(returns, dtype=float)
+    X = X - X.mean(axis=0)
+    T, n = X.shape
+
+    gram = X @ X.T                                  # T x T
+    trace_S = np.trace(gram) / T
+    mu = trace_S / n
+
+    if shrinkage is None:
+        frob_S = np.sum(gram**2) / T**2             # ||S||_F^2
+        d2 = frob_S - trace_S**2 / n                # ||S - μI||_F^2
+        # ||x_t x_t' - S||_F^2 = ||x_t||^4 - 2 x_t' S x_t + ||S||_F^2
+        sq_norms = np.diag(gram)
+        quad = np.sum(gram**2, axis=1) / T
+        b2 = np.sum(sq_norms**2 - 2 * quad + frob_S) / T**2
+        shrinkage = min(b2, d2) / d2 if d2 > 0 else 1.0
+
+    return {
+        'loadings': np.sqrt((1 - shrinkage) / T) * X.T,
+        'diag': np.full(n, shrinkage * mu)
+    }
+
+def _cov_dot(cov_matrix, weights):
+    """Tính Σw cho ma trận dày hoặc dạng low-rank + đường chéo"""
+    if isinstance(cov_matrix, dict):
+        L = cov_matrix['loadings']
+        return L @ (L.T @ weights) + cov_matrix['diag'] * weights
+    return np.dot(cov_matrix, weights)
+
+def _project_capped_simplex(v, max_weight):
+    """
+    Chiếu v lên tập {w: sum(w) = 1, 0 <= w_i <= max_weight}: w = clip(v - τ, 0, max_weight).
+    f(τ) = sum(clip(v - τ, 0, max_weight)) tuyến tính từng đoạn, nên tính f tại mọi điểm gãy
+    (v_i và v_i - max_weight) rồi nội suy tuyến tính để tìm τ với f(τ) = 1.
+    """
+    def excess(sorted_x, cumsum, taus):
+        # sum_{x_i > τ} (x_i - τ) với sorted_x tăng dần
+        idx = np.searchsorted(sorted_x, taus, side='right')
+        total = cumsum[-1] - np.concatenate(([0.0], cumsum))[idx]
+        return total - (len(sorted_x) - idx) * taus
+
+    sorted_v = np.sort(v)
+    cumsum_v = np.cumsum(sorted_v)
+    sorted_u = sorted_v - max_weight
+    cumsum_u = np.cumsum(sorted_u)
+    taus = np.sort(np.concatenate((sorted_v, sorted_u)))
+    f = excess(sorted_v, cumsum_v, taus) - excess(sorted_u, cumsum_u, taus)
+    tau = np.interp(1.0, f[::-1], taus[::-1])
+    return np.clip(v - tau, 0, max_weight)
+
+def _mvo_projected_gradient(expected_returns, cov_matrix, risk_free_rate, max_weight, alpha,
+                            initial_weights, max_iter=1000, rtol=1e-6, memory=10):
+    """
+    Tối đa hóa Sharpe (có penalty) bằng projected gradient với bước Barzilai-Borwein
+    và line search Armijo không đơn điệu (so với giá trị lớn nhất của memory vòng gần nhất,
+    để bước BB ít bị cắt). Gradient giải tích, Σw tính qua _cov_dot nên hỗ trợ
+    cả ma trận dày lẫn dạng low-rank + đường chéo.
+    Dừng khi chuẩn projected gradient ||P(w - ∇f) - w|| nhỏ hơn rtol * ||∇f|| (tương đối theo độ lớn
+    gradient, không theo điểm xuất phát, nên khởi tạo tốt không làm điều kiện dừng chặt hơn).
+    Trả về (weights, success)
+    """
+    def objective_and_grad(weights):
+        cov_w = _cov_dot(cov_matrix, weights)
+        risk = np.sqrt(max(weights @ cov_w, 0))
+        excess = weights @ expected_returns - risk_free_rate
+        denom = risk + 1e-8
+        value = -excess / denom + alpha * np.sum(weights**2)
+        # d(-r/(σ+ε))/dw = -μ/(σ+ε) + r Σw / (σ (σ+ε)^2)
+        grad = -expected_returns / denom + 2 * alpha * weights
+        if risk > 0:
+            grad += excess * cov_w / (risk * denom**2)
+        return value, grad
+
+    def projected_gradient_norm(weights, grad):
+        return np.linalg.norm(_project_capped_simplex(weights - grad, max_weight) - weights)
+
+    weights = _project_capped_simplex(initial_weights, max_weight)
+    value, grad = objective_and_grad(weights)
+    tol = rtol * max(np.linalg.norm(grad), 1e-12)
+    # Bước đầu: bước BB ước lượng từ một bước gradient ngắn (khởi tạo tốt thì gradient nhỏ,
+    # 1/||∇f|| sẽ quá dài hoặc quá ngắn so với độ cong thật)
+    probe = _project_capped_simplex(weights - grad / (np.linalg.norm(grad) + 1e-12) * 1e-3, max_weight)
+    s, y = probe - weights, objective_and_grad(probe)[1] - grad
+    step = (s @ s) / (s @ y) if s @ y > 1e-20 else 1.0 / (np.linalg.norm(grad) + 1e-12)
+    recent = [value]
+
+    for _ in range(max_iter):
+        reference = max(recent[-memory:])
+        while True:
+            candidate = _project_capped_simplex(weights - step * grad, max_weight)
+            direction = candidate - weights
+            new_value, new_grad = objective_and_grad(candidate)
+            if new_value <= reference + 1e-4 * grad @ direction or step < 1e-20:
+                break
+            step /= 2
+
+        # Bước Barzilai-Borwein cho vòng lặp tiếp theo (giới hạn để tránh bước quá lớn / quá nhỏ)
+        grad_diff = new_grad - grad
+        curvature = direction @ grad_diff
+        step = np.clip((direction @ direction) / curvature, 1e-10, 1e10) if curvature > 1e-20 else step * 2
+
+        weights, value, grad = candidate, new_value, new_grad
+        recent.append(value)
+        if projected_gradient_norm(weights, grad) <= tol:
+            return weights, True
+
+    return weights, False
+
+
 #-----------------------------------------------------------------------------------------------------------------------------------------
 # MVO
 def mvo_optimization(expected_returns, cov_matrix, 
                      risk_free_rate=0.02/52,
                      max_weight=0.4,    # Giới hạn trọng số tối đa
-                     alpha=0.1):       # Mức phạt danh mục tập trung
+                     alpha=0.1,        # Mức phạt danh mục tập trung
+                     solver='auto',    # 'slsqp', 'pgd' hoặc 'auto'
+                     initial_weights=None):  # Điểm xuất phát (ví dụ trọng số kỳ trước), mặc định chia đều
     """
     Tối ưu hóa danh mục đầu tư theo phương pháp Mean-Variance Optimization (MVO)
     với các ràng buộc nâng cao:
       - Tổng trọng số = 1
       - 0 <= w_i <= max_weight (để tránh dồn hết vào 1 mã)
       - Thêm penalty alpha * sum(w_i^2) nếu alpha > 0 (để tránh danh mục tập trung)
+
+    solver:
+      - 'slsqp': SLSQP của scipy (phù hợp danh mục nhỏ)
+      - 'pgd': projected gradient với gradient giải tích, dùng cho danh mục lớn.
+        cov_matrix có thể là ma trận dày hoặc dict dạng low-rank + đường chéo
+        (kết quả của factor_covariance / shrinkage_covariance)
+      - 'auto': 'slsqp' nếu cov_matrix là ma trận dày và n <= 200, ngược lại 'pgd'
+
+    initial_weights: điểm xuất phát của bộ giải (warm start, ví dụ trọng số của lần tái cân bằng trước);
+    cũng là kết quả trả về khi tối ưu hóa không thành công
     """
     n = len(expected_returns)
+    if n * max_weight < 1 - 1e-9:
+        raise ValueError(f"Không có danh mục hợp lệ: {n} mã với max_weight={max_weight} "
+                         f"(cần ít nhất {int(np.ceil(1 / max_weight - 1e-9))} mã hoặc tăng max_weight)")
+    if initial_weights is None:
+        initial_weights = np.array([1/n] * n)
+    else:
+        initial_weights = _project_capped_simplex(np.asarray(initial_weights, dtype=float), max_weight)
+
+    if solver == 'auto':
+        solver = 'slsqp' if not isinstance(cov_matrix, dict) and n <= 200 else 'pgd'
+
+    if solver == 'pgd':
+        try:
+            weights, success = _mvo_projected_gradient(
+                np.asarray(expected_returns, dtype=float), cov_matrix,
+                risk_free_rate, max_weight, alpha, initial_weights)
+            if not success:
+                print("Tối ưu hóa chưa hội tụ, dùng kết quả của vòng lặp cuối")
+            # Làm tròn các trọng số nhỏ
+            weights[weights < 1e-4] = 0
+            # Chuẩn hóa lại để tổng = 1 (tránh sai số số học)
+            if np.sum(weights) > 0:
+                weights = weights / np.sum(weights)
+            else:
+                weights = initial_weights
+            return weights
+        except Exception as e:
+            print(f"Lỗi trong quá trình tối ưu hóa: {e}")
+            return initial_weights
 
     # Hàm mục tiêu: Tối đa hóa Sharpe Ratio (hoặc tối thiểu hóa -Sharpe)
     def negative_sharpe_ratio(weights):
@@ -71,9 +379,6 @@ def mvo_optimization(expected_returns, cov_matrix,
     # Biên: 0 <= w_i <= max_weight
     bounds = tuple((0, max_weight) for _ in range(n))
 
-    # Giá trị ban đầu cho thuật toán tối ưu
-    initial_weights = np.array([1/n] * n)
-
     try:
         result = minimize(
             negative_sharpe_ratio, 
@@ -110,7 +415,7 @@ def portfolio_return(weights, expected_returns):
 
 def portfolio_volatility(weights, cov_matrix):
     """Tính rủi ro (độ biến động) của danh mục đầu tư"""
-    return np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
+    return np.sqrt(np.dot(weights.T, _cov_dot(cov_matrix, weights)))
 
 def portfolio_sharpe_ratio(weights, expected_returns, cov_matrix, risk_free_rate=0.02/52):
     """Tính Sharpe ratio của danh mục đầu tư"""
@@ -119,55 +424,271 @@ def portfolio_sharpe_ratio(weights, expected_returns, cov_matrix, risk_free_rate
     return (portfolio_ret - risk_free_rate) / portfolio_vol if portfolio_vol > 0 else 0
 
 
+#----------------------------------------------------------------------------------------------------------------------------
+# Đường biên hiệu quả (Efficient Frontier)
+def _min_variance_active_set(cov_matrix, A, b, weights, max_weight, max_iter=1000):
+    """
+    Giải bài toán min w'Σw với A w = b, 0 <= w_i <= max_weight bằng phương pháp
+    active set (primal), xuất phát từ weights (dùng để warm start). weights phải nằm trong
+    biên nhưng có thể chưa thỏa A w = b: phần sai lệch được đưa vào bước KKT.
+    Mỗi vòng lặp giải hệ KKT trên các mã tự do, rồi thêm 1 mã chạm biên
+    hoặc bỏ 1 mã có nhân tử Lagrange sai dấu khỏi tập ràng buộc active.
+    Trả về (weights, success).
+    """
+    n = cov_matrix.shape[0]
+    m = A.shape[0]
+    tol = 1e-12
+    weights = np.clip(weights, 0, max_weight)
+    lower = weights <= tol
+    upper = weights >= max_weight - tol
+
+    for _ in range(max_iter):
+        free = ~(lower | upper)
+        k = free.sum()
+        grad = 2 * cov_matrix @ weights
+
+        residual = b - A @ weights
+
+        # Hệ KKT cho bước p: [2Σ_FF  A_F'; A_F  0] [p_F; λ] = [-g_F; b - A w]
+        kkt = np.zeros((k + m, k + m))
+        kkt[:k, :k] = 2 * cov_matrix[np.ix_(free, free)]
+        kkt[:k, k:] = A[:, free].T
+        kkt[k:, :k] = A[:, free]
+        rhs = np.concatenate((-grad[free], residual))
+        try:
+            solution = np.linalg.solve(kkt, rhs)
+        except np.linalg.LinAlgError:
+            solution = np.linalg.lstsq(kkt, rhs, rcond=None)[0]
+        step = np.zeros(n)
+        step[free] = solution[:k]
+
+        if np.abs(step).max() <= 1e-10:
+            if np.abs(residual).max() > 1e-10 * (np.abs(b).max() + 1e-300):
+                # Không còn đủ mã tự do để thỏa mãn ràng buộc đẳng thức
+                return weights, False
+            # Nhân tử Lagrange của các ràng buộc biên: mã ở biên 0 cần >= 0, ở biên trên cần <= 0
+            multipliers = grad + A.T @ solution[k:]
+            scale = np.abs(grad).max() + 1e-300
+            wrong_sign = np.where(lower, -multipliers, 0) + np.where(upper, multipliers, 0)
+            worst = np.argmax(wrong_sign)
+            if wrong_sign[worst] <= 1e-9 * scale:
+                return weights, True
+            lower[worst] = upper[worst] = False
+            continue
+
+        # Độ dài bước lớn nhất để các mã tự do không vượt biên
+        ratios = np.full(n, np.inf)
+        decreasing = free & (step < 0)
+        increasing = free & (step > 0)
+        ratios[decreasing] = -weights[decreasing] / step[decreasing]
+        ratios[increasing] = (max_weight - weights[increasing]) / step[increasing]
+        blocking = np.argmin(ratios)
+        alpha = min(1.0, ratios[blocking])
+
+        weights = weights + alpha * step
+        if ratios[blocking] < 1.0:
+            if step[blocking] < 0:
+                weights[blocking] = 0.0
+                lower[blocking] = True
+            else:
+                weights[blocking] = max_weight
+                upper[blocking] = True
+
+    return weights, False
+
+
+def efficient_frontier(expected_returns, cov_matrix, num_points=100,
+                       max_weight=0.4, return_weights=False):
+    """
+    Vẽ đường biên hiệu quả chính xác bằng cách quét các mức lợi nhuận mục tiêu
+    và giải bài toán tối thiểu phương sai có ràng buộc cho từng mức:
+      - Tổng trọng số = 1
+      - 0 <= w_i <= max_weight (giống mvo_optimization)
+      - Lợi nhuận danh mục = target
+    Mỗi lần giải được khởi tạo từ tập ràng buộc active của điểm trước đó (warm start),
+    nếu không hội tụ thì giải lại bằng SLSQP từ trọng số của điểm trước đó.
+
+    Trả về mảng (num_points, 2) gồm các cặp (rủi ro, lợi nhuận), cùng định dạng với
+    'efficient_frontier' của monte_carlo_simulation. Điểm không giải được có rủi ro = NaN.
+    Nếu return_weights=True, trả thêm ma trận trọng số (num_points, n).
+    """
+    expected_returns = np.asarray(expected_returns, dtype=float)
+    cov_matrix = np.asarray(cov_matrix, dtype=float)
+    n = len(expected_returns)
+    bounds = tuple((0, max_weight) for _ in range(n))
+
+    # Cộng một lượng rất nhỏ vào đường chéo để hệ KKT luôn khả nghịch
+    # (cov_matrix suy biến khi số mã lớn hơn số quan sát, ví dụ 52 tuần)
+    cov_reg = cov_matrix + 1e-6 * np.trace(cov_matrix) / n * np.eye(n)
+
+    # Điểm đầu: danh mục rủi ro thấp nhất (chỉ ràng buộc tổng trọng số = 1)
+    initial_weights = np.array([1/n] * n)
+    weights, success = _min_variance_active_set(cov_reg, np.ones((1, n)), np.array([1.0]),
+                                                initial_weights, max_weight)
+    if not success:
+        weights = initial_weights
+    min_return = portfolio_return(weights, expected_returns)
+
+    # Lợi nhuận lớn nhất có thể đạt được: dồn max_weight vào các mã có lợi nhuận cao nhất
+    max_return_weights = np.zeros(n)
+    remaining = 1.0
+    for i in np.argsort(expected_returns)[::-1]:
+        max_return_weights[i] = min(max_weight, remaining)
+        remaining -= max_return_weights[i]
+        if remaining <= 0:
+            break
+    max_return = portfolio_return(max_return_weights, expected_returns)
+
+    target_returns = np.linspace(min_return, max_return, num_points)
+    frontier = np.full((num_points, 2), np.nan)
+    frontier[:, 1] = target_returns
+    frontier_weights = np.full((num_points, n), np.nan)
+    A = np.vstack((np.ones(n), expected_returns))
+
+    for i, target in enumerate(target_returns):
+        b = np.array([1.0, target])
+
+        # Warm start từ trọng số (và tập ràng buộc active) của điểm trước đó
+        new_weights, success = _min_variance_active_set(cov_reg, A, b, weights, max_weight)
+
+        if not success:
+            # Dịch trọng số của điểm trước về phía danh mục lợi nhuận lớn nhất vừa đủ
+            # để đạt target (tổ hợp lồi nên vẫn thỏa mãn các ràng buộc), rồi giải lại
+            current_return = portfolio_return(weights, expected_returns)
+            if max_return - current_return > 1e-15:
+                theta = np.clip((target - current_return) / (max_return - current_return), 0, 1)
+                start = (1 - theta) * weights + theta * max_return_weights
+            else:
+                start = max_return_weights
+            new_weights, success = _min_variance_active_set(cov_reg, A, b, start, max_weight)
+
+        if not success:
+            constraints = [
+                {'type': 'eq', 'fun': lambda w: np.sum(w) - 1, 'jac': lambda w: np.ones(n)},
+                {'type': 'eq', 'fun': lambda w, t=target: w @ expected_returns - t,
+                 'jac': lambda w: expected_returns}
+            ]
+            opt = minimize(lambda w: w @ cov_reg @ w, weights, jac=lambda w: 2 * cov_reg @ w,
+                           method='SLSQP', bounds=bounds, constraints=constraints,
+                           options={'maxiter': 1000})
+            if not opt['success']:
+                continue
+            new_weights = opt['x']
+
+        weights = new_weights
+        frontier[i, 0] = np.sqrt(max(weights @ cov_matrix @ weights, 0))
+        frontier_weights[i] = weights
+
+    if return_weights:
+        return frontier, frontier_weights
+    return frontier
+
+
 #----------------------------------------------------------------------------------------------------------------------------
 # Phương pháp Monte Carlo
+def _monte_carlo_block(expected_returns, cov_matrix, risk_free_rate, block_size, max_weight, rng, keep=None):
+    """
+    Mô phỏng một khối block_size danh mục cùng lúc (không dùng vòng lặp Python).
+    Chỉ giữ lại trọng số của danh mục Sharpe cao nhất và rủi ro thấp nhất trong khối.
+    Với keep < block_size chỉ giữ (rủi ro, lợi nhuận) của keep danh mục chọn ngẫu nhiên cùng các điểm
+    trên biên trên của khối (lợi nhuận cao nhất tính tới mỗi mức rủi ro) để vẽ.
+    """
+    num_assets = len(expected_returns)
+
+    # Ma trận trọng số (block_size x num_assets), chuẩn hóa mỗi hàng có tổng = 1
+    weights = rng.uniform(0, max_weight, (block_size, num_assets))
+    weights /= weights.sum(axis=1, keepdims=True)
+
+    # Lợi nhuận, rủi ro và Sharpe của cả khối
+    rets = weights @ expected_returns
+    vols = np.sqrt(np.maximum(np.einsum('ij,jk,ik->i', weights, cov_matrix, weights, optimize=True), 0))
+    sharpes = np.divide(rets - risk_free_rate, vols, out=np.zeros_like(rets), where=vols > 0)
+
+    max_sharpe_idx = np.argmax(sharpes)
+    min_vol_idx = np.argmin(vols)
+
+    points = np.column_stack((vols, rets))
+    if keep is not None and keep < block_size:
+        order = np.argsort(vols)
+        sorted_rets = rets[order]
+        # Điểm biên trên: lợi nhuận lớn hơn mọi điểm có rủi ro thấp hơn
+        envelope = order[sorted_rets > np.concatenate(([-np.inf], np.maximum.accumulate(sorted_rets)[:-1]))]
+        sample = rng.choice(block_size, keep, replace=False)
+        points = points[np.union1d(sample, envelope)]
+
+    return {
+        'max_sharpe': (weights[max_sharpe_idx].copy(), rets[max_sharpe_idx], vols[max_sharpe_idx], sharpes[max_sharpe_idx]),
+        'min_volatility': (weights[min_vol_idx].copy(), rets[min_vol_idx], vols[min_vol_idx], sharpes[min_vol_idx]),
+        'efficient_frontier': points
+    }
+
+
+def _monte_carlo_block_job(args):
+    """Hàm bọc để chạy _monte_carlo_block trong process pool"""
+    expected_returns, cov_matrix, risk_free_rate, block_size, max_weight, seed, keep = args
+    return _monte_carlo_block(expected_returns, cov_matrix, risk_free_rate, block_size,
+                              max_weight, np.random.default_rng(seed), keep)
+
+
 def monte_carlo_simulation(expected_returns, cov_matrix, risk_free_rate=0.02/52, 
-                                   num_simulations=50000, max_weight=0.4):
+                                   num_simulations=50000, max_weight=0.4,
+                                   rng=None,            # numpy.random.Generator hoặc seed
+                                   max_memory_mb=256,   # Giới hạn bộ nhớ cho mỗi khối
+                                   n_jobs=1,            # Số tiến trình (n_jobs > 1 dùng process pool)
+                                   max_points=100_000): # Số điểm (rủi ro, lợi nhuận) tối đa giữ lại để vẽ
+    """
+    Mô phỏng Monte Carlo theo từng khối: mỗi khối sinh cả ma trận trọng số và tính
+    lợi nhuận, rủi ro (einsum trên cov_matrix), Sharpe cho toàn khối cùng lúc.
+    Kích thước khối được chọn sao cho bộ nhớ tạm không vượt quá max_memory_mb.
+    'efficient_frontier' giữ tất cả các điểm khi num_simulations <= max_points; nếu nhiều hơn, mỗi khối
+    chỉ giữ phần mẫu ngẫu nhiên tương ứng cùng biên trên của khối, nên kết quả không tăng theo
+    num_simulations (max_points=None: giữ tất cả).
+    """
+    expected_returns = np.asarray(expected_returns, dtype=float)
+    cov_matrix = np.asarray(cov_matrix, dtype=float)
     num_assets = len(expected_returns)
-    results = np.zeros((num_simulations, num_assets + 3))  # +3 for return, volatility, sharpe
-    
-    for i in range(num_simulations):
-        # Tạo trọng số ngẫu nhiên với ràng buộc max_weight
-        weights = np.random.uniform(0, max_weight, num_assets)
-        # Chuẩn hóa tổng = 1
-        weights = weights / np.sum(weights)
-        
-        # Tính toán lợi nhuận và rủi ro của danh mục
-        portfolio_ret = portfolio_return(weights, expected_returns)
-        portfolio_vol = portfolio_volatility(weights, cov_matrix)
-        sharpe = (portfolio_ret - risk_free_rate) / portfolio_vol if portfolio_vol > 0 else 0
-        
-        # Lưu kết quả
-        results[i, :num_assets] = weights
-        results[i, num_assets] = portfolio_ret
-        results[i, num_assets + 1] = portfolio_vol
-        results[i, num_assets + 2] = sharpe
-    
-    # Tìm danh mục có tỷ lệ Sharpe cao nhất
-    max_sharpe_idx = np.argmax(results[:, num_assets + 2])
-    
-    optimal_weights = results[max_sharpe_idx, :num_assets]
-    optimal_return = results[max_sharpe_idx, num_assets]
-    optimal_vol = results[max_sharpe_idx, num_assets + 1]
-    optimal_sharpe = results[max_sharpe_idx, num_assets + 2]
-    
-    # Tìm danh mục có rủi ro thấp nhất
-    min_vol_idx = np.argmin(results[:, num_assets + 1])
-    min_vol_weights = results[min_vol_idx, :num_assets]
-    
+    rng = np.random.default_rng(rng)
+
+    # Mỗi danh mục cần khoảng 2 ma trận tạm kích thước num_assets (float64)
+    bytes_per_portfolio = 8 * (2 * num_assets + 4)
+    block_size = max(1, min(num_simulations, int(max_memory_mb * 1024**2 // bytes_per_portfolio)))
+    block_sizes = [block_size] * (num_simulations // block_size)
+    if num_simulations % block_size:
+        block_sizes.append(num_simulations % block_size)
+    if max_points is None or num_simulations <= max_points:
+        keeps = [None] * len(block_sizes)
+    else:
+        keeps = [min(size, -(-max_points * size // num_simulations)) for size in block_sizes]
+
+    if n_jobs is not None and n_jobs > 1 and len(block_sizes) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Mỗi khối có seed riêng sinh từ rng để kết quả tái lập được
+        seeds = rng.integers(0, 2**63 - 1, size=len(block_sizes))
+        jobs = [(expected_returns, cov_matrix, risk_free_rate, size, max_weight, int(seed), keep)
+                for size, seed, keep in zip(block_sizes, seeds, keeps)]
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            blocks = list(executor.map(_monte_carlo_block_job, jobs))
+    else:
+        blocks = [_monte_carlo_block(expected_returns, cov_matrix, risk_free_rate, size, max_weight, rng, keep)
+                  for size, keep in zip(block_sizes, keeps)]
+
+    # Tìm danh mục có tỷ lệ Sharpe cao nhất và rủi ro thấp nhất trên tất cả các khối
+    best = max((block['max_sharpe'] for block in blocks), key=lambda x: x[3])
+    min_vol = min((block['min_volatility'] for block in blocks), key=lambda x: x[2])
+
     return {
         'max_sharpe': {
-            'weights': optimal_weights,
-            'return': optimal_return,
-            'risk': optimal_vol,
-            'sharpe': optimal_sharpe
+            'weights': best[0],
+            'return': best[1],
+            'risk': best[2],
+            'sharpe': best[3]
         },
         'min_volatility': {
-            'weights': min_vol_weights,
-            'return': results[min_vol_idx, num_assets],
-            'risk': results[min_vol_idx, num_assets + 1],
-            'sharpe': results[min_vol_idx, num_assets + 2]
+            'weights': min_vol[0],
+            'return': min_vol[1],
+            'risk': min_vol[2],
+            'sharpe': min_vol[3]
         },
-        'efficient_frontier': results[:, [num_assets + 1, num_assets]]  # risk, return pairs
+        'efficient_frontier': np.concatenate([block['efficient_frontier'] for block in blocks])  # risk, return pairs
     }
-
@@ -0,0 +1,539 @@
+"""
+Chạy toàn bộ luồng download -> parse -> merge -> clean -> features -> forecast -> screen -> optimize -> report
+bằng các hàm có sẵn (ParseSourcePage, TransactionMaster, clean_universe, load_features, screen_stocks,
+mvo_optimization, ...), thay cho việc chạy tay các notebook theo thứ tự.
+
+Các bước được khai báo thành đồ thị phụ thuộc; kết quả của mỗi bước được lưu theo mã băm nội dung đầu vào
++ tham số, bước có đầu vào không đổi được đọc lại từ cache. Các bước theo từng mã (parse, forecast) chạy
+song song theo mã và chỉ tính lại các mã có dữ liệu thay đổi. Mỗi bước ghi thời gian, CPU, bộ nhớ đỉnh,
+số dòng và số lần trúng cache vào metrics (JSON lines + CSV).
+
+    python pipeline.py --lsgd-dir ../data/LSGD --output-dir ../data/pipeline
+    python pipeline.py --history ../data/processed/transaction_history.csv --stock-codes ACB,FPT,VCB
+    python pipeline.py --lsgd-dir ../data/LSGD --download --stock-codes acb --force clean
+"""
+import argparse
+import csv
+import hashlib
+import importlib
+import json
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_store import read_history_frame
+from features import READ_DATA_COLUMNS, READ_DATA_SPEC, load_features
+from model_registry import data_hash
+from optim_funtions import (calculate_returns_risk, mvo_optimization, portfolio_return, portfolio_sharpe_ratio,
+                            portfolio_volatility)
+from preprocessing import clean_universe
+from screening import pivot_market, screen_stocks
+from transaction_merge import KEY_COLUMNS, TransactionMaster
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+PIPELINE_DIR = ROOT_DIR / 'data' / 'pipeline'
+
+# peak_rss_mb: RSS đỉnh của tiến trình tính từ khi khởi động (chỉ tăng dần qua các bước);
+# rss_delta_mb: RSS sau bước trừ RSS trước bước - bước nào làm tăng bộ nhớ
+METRIC_COLUMNS = ['run_id', 'stage', 'status', 'wall_s', 'cpu_s', 'peak_traced_mb', 'peak_rss_mb', 'rss_delta_mb',
+                  'rows_in', 'rows_out', 'tickers', 'cache_hits', 'cache_misses', 'error']
+
+
+def content_hash(obj):
+    """Mã băm nội dung của kết quả một bước (dict / list lồng nhau, DataFrame, mảng numpy, giá trị khác)"""
+    if isinstance(obj, dict):
+        parts = [f'{key!r}:{content_hash(obj[key])}' for key in sorted(obj, key=str)]
+        return data_hash('dict', *parts)
+    if isinstance(obj, (list, tuple)):
+        return data_hash(type(obj).__name__, *[content_hash(item) for item in obj])
+    return data_hash(obj)
+
+
+def path_signature(path):
+    """Chữ ký (đường dẫn tương đối, kích thước, mtime) của một file hoặc mọi file trong thư mục"""
+    path = Path(path)
+    files = [path] if path.is_file() else sorted(p for p in path.rglob('*') if p.is_file())
+    h = hashlib.sha1()
+    for file in files:
+        stat = file.stat()
+        h.update(f'{file.relative_to(path) if file != path else file.name}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+    return h.hexdigest()
+
+
+def _count_rows(obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(_count_rows(value) for value in obj.values())
+    return 0
+
+
+def _rss_mb():
+    """RSS hiện tại của process (MB): psutil nếu có, ngược lại /proc/self/statm (Linux)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024**2
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024**2
+    except (OSError, ValueError, AttributeError):
+        return float('nan')
+
+
+def _peak_rss_mb():
+    """
+    RSS đỉnh của process (MB) kể từ khi khởi động (high-water mark, không phải của riêng một bước):
+    ru_maxrss trên Linux / macOS, psutil nếu không có module resource
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+    except ImportError:
+        return float('nan')
+    info = psutil.Process().memory_info()
+    return getattr(info, 'peak_wset', info.rss) / 1024**2
+
+
+def _measure(fn, args, kwargs, trace_memory=False):
+    """
+    Chạy fn(*args, **kwargs), trả về (kết quả, metrics của lần chạy).
+    trace_memory: đo bộ nhớ đỉnh của riêng lần chạy bằng tracemalloc (làm code Python chậm đi nhiều lần,
+    nên mặc định chỉ ghi RSS đỉnh của tiến trình)
+    """
+    if trace_memory:
+        tracemalloc.start()
+    rss = _rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        result = fn(*args, **kwargs)
+        peak_traced = tracemalloc.get_traced_memory()[1] / 1024**2 if trace_memory else float('nan')
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return result, {
+        'wall_s': time.perf_counter() - wall,
+        'cpu_s': time.process_time() - cpu,
+        'peak_traced_mb': peak_traced,
+        'peak_rss_mb': _peak_rss_mb(),
+        'rss_delta_mb': _rss_mb() - rss,
+    }
+
+
+def _measure_job(args):
+    return _measure(*args)
+
+
+class Stage:
+    """
+    Một bước của pipeline: fn(*kết quả các bước deps, **params).
+    per_ticker=True: kết quả của bước phụ thuộc đầu tiên là dictionary {mã: dữ liệu}, fn được gọi cho từng mã
+    (song song, cache theo từng mã); các bước phụ thuộc còn lại được truyền nguyên vẹn.
+    always_run=True: luôn chạy (bước rẻ có tác dụng phụ như tải dữ liệu, ghi báo cáo).
+    Tăng version khi thay đổi cách tính để cache cũ bị bỏ qua.
+    """
+
+    def __init__(self, name, fn, deps=(), params=None, per_ticker=False, always_run=False, version=1):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.params = params or {}
+        self.per_ticker = per_ticker
+        self.always_run = always_run
+        self.version = version
+
+    def key(self, input_hashes):
+        payload = json.dumps([self.name, self.version, self.params, input_hashes], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+class Pipeline:
+    """
+    Đồ thị các Stage, chạy theo thứ tự topo. Kết quả được lưu trong cache_dir/<bước>/<khóa>.pkl
+    (per_ticker: cache_dir/<bước>/<mã>/<khóa>.pkl), kèm mã băm nội dung của kết quả để bước sau
+    chỉ chạy lại khi nội dung đầu vào thật sự thay đổi.
+    """
+
+    def __init__(self, cache_dir, metrics_dir=None, max_workers=None, trace_memory=False):
+        self.cache_dir = cache_dir
+        self.metrics_dir = metrics_dir
+        self.max_workers = max_workers
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    def add(self, stage):
+        self.stages[stage.name] = stage
+        return stage
+
+    def order(self, targets=None):
+        """Các bước cần chạy để có targets (mặc định: tất cả), theo thứ tự phụ thuộc"""
+        ordered, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name not in self.stages:
+                raise ValueError(f"Không có bước '{name}' trong pipeline")
+            if name in visiting:
+                raise ValueError(f"Phụ thuộc vòng tại bước '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            ordered.append(name)
+
+        for name in targets or self.stages:
+            visit(name)
+        return ordered
+
+    def _load(self, folder, key):
+        path = os.path.join(folder, f'{key}.pkl')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def _save(self, folder, key, result, output_hash):
+        """Ghi (kết quả, mã băm) vào file tạm rồi đổi tên, xóa các khóa cũ của cùng bước / mã"""
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'{key}.pkl')
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump((result, output_hash), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        for name in os.listdir(folder):
+            if name.endswith('.pkl') and name != f'{key}.pkl':
+                os.remove(os.path.join(folder, name))
+
+    def _run_single(self, stage, inputs, input_hashes, force):
+        folder = os.path.join(self.cache_dir, stage.name)
+        key = stage.key(input_hashes)
+        start, cpu, rss = time.perf_counter(), time.process_time(), _rss_mb()
+        cached = None if force or stage.always_run else self._load(folder, key)
+        if cached is not None:
+            result, output_hash = cached
+            # Thời gian của bước trúng cache là thời gian đọc lại kết quả
+            metrics = {'status': 'cached', 'wall_s': time.perf_counter() - start, 'cpu_s': time.process_time() - cpu,
+                       'peak_traced_mb': float('nan'), 'peak_rss_mb': _peak_rss_mb(),
+                       'rss_delta_mb': _rss_mb() - rss, 'cache_hits': 1, 'cache_misses': 0}
+            return result, output_hash, metrics
+
+        result, metrics = _measure(stage.fn, inputs, stage.params, self.trace_memory)
+        output_hash = content_hash(result)
+        self._save(folder, key, result, output_hash)
+        return result, output_hash, {'status': 'run', **metrics, 'cache_hits': 0, 'cache_misses': 1}
+
+    def _run_per_ticker(self, stage, inputs, input_hashes, force):
+        tickers, others = inputs[0], inputs[1:]
+        if not isinstance(tickers, dict):
+            raise ValueError(f"Bước '{stage.name}' cần kết quả dạng {{mã: dữ liệu}} từ '{stage.deps[0]}'")
+        start, cpu, rss = time.perf_counter(), time.process_time(), _rss_mb()
+        results, hashes, keys, misses = {}, {}, {}, []
+        for code, data in tickers.items():
+            keys[code] = stage.key([content_hash(data)] + input_hashes[1:])
+            cached = None if force or stage.always_run else self._load(os.path.join(self.cache_dir, stage.name, str(code)), keys[code])
+            if cached is None:
+                misses.append(code)
+            else:
+                results[code], hashes[code] = cached
+
+        jobs = [(stage.fn, (tickers[code], *others), stage.params, self.trace_memory) for code in misses]
+        parallel = self.max_workers != 1 and len(jobs) > 1
+        if not parallel:
+            outcomes = [_measure_job(job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                outcomes = list(executor.map(_measure_job, jobs))
+
+        job_metrics = []
+        for code, (result, metrics) in zip(misses, outcomes):
+            results[code], hashes[code] = result, content_hash(result)
+            self._save(os.path.join(self.cache_dir, stage.name, str(code)), keys[code], result, hashes[code])
+            job_metrics.append(metrics)
+
+        metrics = {
+            'status': 'run' if misses else 'cached',
+            'wall_s': time.perf_counter() - start,
+            # Chạy song song: CPU của tiến trình chính (đọc cache, băm) cộng CPU của các tiến trình con
+            'cpu_s': time.process_time() - cpu + (sum(m['cpu_s'] for m in job_metrics) if parallel else 0.0),
+            'peak_traced_mb': max((m['peak_traced_mb'] for m in job_metrics), default=float('nan')),
+            'peak_rss_mb': max([m['peak_rss_mb'] for m in job_metrics] + [_peak_rss_mb()]),
+            # Chạy song song: tăng RSS của tiến trình chính cộng mức tăng lớn nhất trong một tiến trình con
+            'rss_delta_mb': _rss_mb() - rss + (max((m['rss_delta_mb'] for m in job_metrics), default=0.0)
+                                               if parallel else 0.0),
+            'cache_hits': len(tickers) - len(misses),
+            'cache_misses': len(misses),
+        }
+        results = {code: results[code] for code in tickers}
+        return results, content_hash({code: hashes[code] for code in tickers}), metrics
+
+    def run(self, targets=None, force=()):
+        """
+        Chạy các bước cần thiết cho targets. force: tên các bước bắt buộc chạy lại (bỏ qua cache).
+
+        Returns:
+        --------
+        (Dictionary {bước: kết quả}, list metrics của từng bước)
+        """
+        run_id = datetime.now().strftime('%Y%m%dT%H%M%S')
+        outputs, hashes, records = {}, {}, []
+        for name in self.order(targets):
+            stage = self.stages[name]
+            inputs = [outputs[dep] for dep in stage.deps]
+            input_hashes = [hashes[dep] for dep in stage.deps]
+            runner = self._run_per_ticker if stage.per_ticker else self._run_single
+            record = {'run_id': run_id, 'stage': name, 'rows_in': sum(_count_rows(x) for x in inputs)}
+            start, cpu, rss = time.perf_counter(), time.process_time(), _rss_mb()
+            # Metrics của mỗi bước được ghi ngay khi bước kết thúc, kể cả khi lỗi (status='failed')
+            try:
+                outputs[name], hashes[name], metrics = runner(stage, inputs, input_hashes, name in force)
+                record.update(metrics, rows_out=_count_rows(outputs[name]),
+                              tickers=len(outputs[name]) if isinstance(outputs[name], dict) else None)
+            except BaseException as e:
+                record.update(status='failed', wall_s=time.perf_counter() - start, cpu_s=time.process_time() - cpu,
+                              peak_rss_mb=_peak_rss_mb(), rss_delta_mb=_rss_mb() - rss, error=repr(e))
+                raise
+            finally:
+                record = {column: record.get(column) for column in METRIC_COLUMNS}
+                records.append(record)
+                if self.metrics_dir:
+                    write_metrics([record], self.metrics_dir)
+                print(f"[{name}] {record['status']}: {record['wall_s']:.2f}s, CPU {record['cpu_s']:.2f}s, "
+                      f"RSS {record['rss_delta_mb']:+.1f} MB, cache {record['cache_hits'] or 0}/"
+                      f"{(record['cache_hits'] or 0) + (record['cache_misses'] or 0)}")
+        return outputs, records
+
+
+def write_metrics(records, metrics_dir):
+    """Nối các bản ghi metrics vào metrics.jsonl và metrics.csv"""
+    os.makedirs(metrics_dir, exist_ok=True)
+    with open(os.path.join(metrics_dir, 'metrics.jsonl'), 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, default=float) + '\n')
+
+    csv_path = os.path.join(metrics_dir, 'metrics.csv')
+    new_file = not os.path.exists(csv_path)
+    with open(csv_path, 'a', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=METRIC_COLUMNS)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(records)
+
+
+# ---- Các bước của luồng xử lý ----
+
+def _import_elt(module):
+    sys.path.insert(0, str(ROOT_DIR / 'elt'))
+    return importlib.import_module(module)
+
+
+def _resolve(spec):
+    """'module:function' -> hàm"""
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def download_stage(lsgd_dir=None, stock_codes=None, download=False, num_workers=4):
+    """
+    Tải các trang LSGD (DownloadScheduler, chỉ khi download=True) rồi liệt kê thư mục của từng mã.
+    Kết quả gồm chữ ký file của từng mã nên parse chỉ chạy lại cho các mã có trang thay đổi.
+    """
+    if lsgd_dir is None:
+        return {}
+    if download:
+        scheduler = _import_elt('DownloadScheduler').DownloadScheduler(lsgd_dir, num_workers=num_workers,
+                                                                       incremental=True)
+        scheduler.add_jobs(stock_codes or [], sources=('LSGD',))
+        failed = [job for job, status in scheduler.run().items() if status['status'] != 'ok']
+        if failed:
+            print(f"Tải lỗi: {failed}")
+
+    wanted = {code.lower() for code in stock_codes} if stock_codes else None
+    ticker_dirs = sorted(d for d in Path(lsgd_dir).iterdir() if d.is_dir())
+    return {d.name.upper(): {'path': str(d), 'signature': path_signature(d)} for d in ticker_dirs
+            if wanted is None or d.name.lower() in wanted}
+
+
+def parse_stage(source):
+    return _import_elt('ParseSourcePage').parse_lsgd_ticker_dir(source['path'])
+
+
+def merge_stage(parsed, history=None, history_signature=None, stock_codes=None):
+    """
+    Upsert lịch sử giao dịch có sẵn (history: CSV hoặc dataset Parquet) rồi các bảng vừa parse
+    vào TransactionMaster (trang mới hơn ghi đè các ngày trùng)
+    """
+    master = TransactionMaster()
+    if history:
+        codes = [code.upper() for code in stock_codes] if stock_codes else None
+        frame = read_history_frame(history, codes)
+        master.upsert(frame.drop_duplicates(KEY_COLUMNS, keep='last').set_index(KEY_COLUMNS), 'history')
+    for stock_code, frame in parsed.items():
+        master.upsert(frame.set_index(KEY_COLUMNS), 'LSGD')
+    return master.to_frame().infer_objects()
+
+
+def clean_stage(merged, start_date='2017-01-01', end_date='2024-12-31', min_rows=400):
+    return clean_universe(merged, start_date=start_date, end_date=end_date, min_rows=min_rows)
+
+
+def features_stage(cleaned, cache_dir=None):
+    """Đặc trưng của read_data cho tất cả các mã, tách thành {mã: DataFrame}"""
+    data = load_features(cleaned, READ_DATA_SPEC, cache_dir=cache_dir)
+    data = data.fillna(0).replace([np.inf, -np.inf], 0)
+    return {code: group[READ_DATA_COLUMNS].reset_index(drop=True)
+            for code, group in data.groupby('stock_code', sort=False)}
+
+
+def recent_path_forecast(data, horizon=20, price_col='closing_price'):
+    """
+    Dự báo mặc định (seasonal naive): horizon phiên tới lặp lại lợi nhuận của horizon phiên gần nhất,
+    bắt đầu từ giá cuối. Có thể thay bằng mô hình của notebook qua --forecast-fn module:function
+    (cùng chữ ký f(data, horizon) -> mảng giá dự báo).
+    """
+    prices = data[price_col].to_numpy(dtype=float)[-(horizon + 1):]
+    return prices[-1] * np.cumprod(prices[1:] / prices[:-1])
+
+
+def forecast_stage(data, horizon=20, forecast_fn=None):
+    fn = _resolve(forecast_fn) if forecast_fn else recent_path_forecast
+    predictions = np.asarray(fn(data, horizon=horizon), dtype=float)
+    return {'predictions': predictions, 'stats': calculate_returns_risk(predictions)}
+
+
+def screen_stage(cleaned, **criteria):
+    return screen_stocks(cleaned, **criteria)
+
+
+def optimize_stage(forecasts, screened, cleaned, top_n=5, cov_sessions=252, risk_free_rate=0.02/52,
+                   max_weight=0.4, alpha=0.1):
+    """
+    Như notebook optimization_stock: chọn top_n mã (đã qua bộ lọc) có Sharpe dự báo cao nhất,
+    lợi nhuận kỳ vọng từ dự báo, hiệp phương sai từ lợi nhuận lịch sử cov_sessions phiên gần nhất.
+    """
+    candidates = [code for code in screened.index if code in forecasts]
+    candidates.sort(key=lambda code: forecasts[code]['stats']['sharpe_ratio'], reverse=True)
+    symbols = candidates[:top_n]
+    if len(symbols) < 2:
+        raise ValueError(f"Cần ít nhất 2 mã để tối ưu danh mục, chỉ có {symbols}")
+
+    prices = pivot_market(cleaned, columns=('closing_price',))['closing_price'][symbols]
+    returns = prices.pct_change().iloc[-cov_sessions:]
+    cov_matrix = np.cov(np.nan_to_num(returns.to_numpy(), nan=0.0, posinf=0.0, neginf=0.0), rowvar=False)
+    expected_returns = np.array([forecasts[code]['stats']['expected_return'] for code in symbols])
+
+    weights = mvo_optimization(expected_returns, cov_matrix, risk_free_rate=risk_free_rate,
+                               max_weight=max_weight, alpha=alpha)
+    return {
+        'symbols': symbols,
+        'weights': weights,
+        'expected_returns': expected_returns,
+        'cov_matrix': cov_matrix,
+        'portfolio': {
+            'expected_return': float(portfolio_return(weights, expected_returns)),
+            'risk': float(portfolio_volatility(weights, cov_matrix)),
+            'sharpe_ratio': float(portfolio_sharpe_ratio(weights, expected_returns, cov_matrix, risk_free_rate)),
+        },
+    }
+
+
+def report_stage(optimized, screened, forecasts, output_dir):
+    """Ghi trọng số danh mục (CSV) và tóm tắt (JSON) vào output_dir"""
+    os.makedirs(output_dir, exist_ok=True)
+    symbols = optimized['symbols']
+    table = pd.DataFrame({
+        'stock_code': symbols,
+        'weight': optimized['weights'],
+        'expected_return': optimized['expected_returns'],
+        'risk': [forecasts[code]['stats']['risk'] for code in symbols],
+        'sharpe_ratio': [forecasts[code]['stats']['sharpe_ratio'] for code in symbols],
+        'screen_rank': screened.loc[symbols, 'rank'].to_numpy(),
+    })
+    table.to_csv(os.path.join(output_dir, 'portfolio.csv'), index=False)
+    with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump({'portfolio': optimized['portfolio'], 'screened': int(len(screened)),
+                   'weights': dict(zip(symbols, map(float, optimized['weights'])))}, f, indent=2)
+    return table
+
+
+def build_pipeline(args):
+    output_dir = Path(args.output_dir)
+    stock_codes = args.stock_codes.split(',') if args.stock_codes else None
+    pipeline = Pipeline(cache_dir=str(output_dir / 'cache'), metrics_dir=str(output_dir / 'metrics'),
+                        max_workers=args.max_workers, trace_memory=args.trace_memory)
+
+    pipeline.add(Stage('download', download_stage, always_run=True, params={
+        'lsgd_dir': args.lsgd_dir, 'stock_codes': stock_codes, 'download': args.download}))
+    pipeline.add(Stage('parse', parse_stage, deps=['download'], per_ticker=True))
+    pipeline.add(Stage('merge', merge_stage, deps=['parse'], params={
+        'history': args.history, 'stock_codes': stock_codes,
+        'history_signature': path_signature(args.history) if args.history else None}))
+    pipeline.add(Stage('clean', clean_stage, deps=['merge'], params={
+        'start_date': args.start_date, 'end_date': args.end_date, 'min_rows': args.min_rows}))
+    pipeline.add(Stage('features', features_stage, deps=['clean'], params={
+        'cache_dir': str(output_dir / 'features')}))
+    pipeline.add(Stage('forecast', forecast_stage, deps=['features'], per_ticker=True, params={
+        'horizon': args.horizon, 'forecast_fn': args.forecast_fn}))
+    pipeline.add(Stage('screen', screen_stage, deps=['clean'], params={
+        'min_avg_volume': args.min_avg_volume, 'max_var': args.max_var, 'min_cagr': args.min_cagr}))
+    pipeline.add(Stage('optimize', optimize_stage, deps=['forecast', 'screen', 'clean'], params={
+        'top_n': args.top_n, 'max_weight': args.max_weight, 'alpha': args.alpha}))
+    pipeline.add(Stage('report', report_stage, deps=['optimize', 'screen', 'forecast'], always_run=True,
+                       params={'output_dir': str(output_dir / 'report')}))
+    return pipeline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chạy pipeline tải -> parse -> ... -> tối ưu danh mục -> báo cáo")
+    parser.add_argument('--lsgd-dir', default=None, help="thư mục data/LSGD/<mã>/ các trang đã lưu")
+    parser.add_argument('--history', default=None, help="lịch sử giao dịch có sẵn (CSV hoặc dataset Parquet)")
+    parser.add_argument('--stock-codes', default=None, help="danh sách mã, cách nhau bởi dấu phẩy")
+    parser.add_argument('--download', action='store_true', help="tải trang mới trước khi parse")
+    parser.add_argument('--output-dir', default=str(PIPELINE_DIR))
+    parser.add_argument('--targets', default=None, help="chỉ chạy tới các bước này (cách nhau bởi dấu phẩy)")
+    parser.add_argument('--force', default='', help="các bước bắt buộc chạy lại")
+    parser.add_argument('--max-workers', type=int, default=None)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="đo bộ nhớ đỉnh của từng bước bằng tracemalloc (chậm hơn)")
+    parser.add_argument('--start-date', default='2017-01-01')
+    parser.add_argument('--end-date', default='2024-12-31')
+    parser.add_argument('--min-rows', type=int, default=400)
+    parser.add_argument('--horizon', type=int, default=20)
+    parser.add_argument('--forecast-fn', default=None, help="hàm dự báo dạng module:function")
+    parser.add_argument('--min-avg-volume', type=float, default=None)
+    parser.add_argument('--max-var', type=float, default=None)
+    parser.add_argument('--min-cagr', type=float, default=None)
+    parser.add_argument('--top-n', type=int, default=5)
+    parser.add_argument('--max-weight', type=float, default=0.4)
+    parser.add_argument('--alpha', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    if not args.lsgd_dir and not args.history:
+        parser.error("cần --lsgd-dir và/hoặc --history")
+
+    pipeline = build_pipeline(args)
+    targets = args.targets.split(',') if args.targets else None
+    outputs, _ = pipeline.run(targets, force=set(filter(None, args.force.split(','))))
+    if 'report' in outputs:
+        print(outputs['report'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+from optim_funtions import efficient_frontier
 
 def plot_portfolio_allocation(mvo_weights, selected_symbols):
     """
@@ -140,43 +141,35 @@ def plot_prediction_comparison(all_predictions, selected_symbols):
     plt.show()
 
 def plot_efficient_frontier(selected_symbols, expected_returns, cov_matrix, 
-                            port_risk, port_return, num_portfolios=10000, 
-                            risk_free_rate=0.02/52, label_mvo='Danh mục MVO'):
+                            port_risk, port_return, num_points=100, 
+                            risk_free_rate=0.02/52, label_mvo='Danh mục MVO',
+                            max_weight=1, frontier=None):
     """
     7. Biểu đồ đường hiệu quả (Efficient Frontier)
-       - Sinh num_portfolios danh mục ngẫu nhiên để tạo scatter.
+       - Đường biên được tính chính xác bằng efficient_frontier (num_points điểm),
+         hoặc truyền sẵn mảng frontier (cột 0 là rủi ro, cột 1 là lợi nhuận).
        - Đánh dấu danh mục tối ưu MVO trên biểu đồ.
     """
-    results = np.zeros((3, num_portfolios))
-    weights_record = []
-    n = len(selected_symbols)
-
-    for i in range(num_portfolios):
-        weights = np.random.random(n)
-        weights /= np.sum(weights)
-        weights_record.append(weights)
-        
-        p_return = np.sum(weights * expected_returns)
-        p_risk = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
-        p_sharpe = (p_return - risk_free_rate) / p_risk if p_risk > 0 else 0
-        
-        results[0, i] = p_return
-        results[1, i] = p_risk
-        results[2, i] = p_sharpe
+    if frontier is None:
+        frontier = efficient_frontier(expected_returns, cov_matrix, num_points=num_points,
+                                      max_weight=max_weight)
+    frontier = frontier[~np.isnan(frontier).any(axis=1)]
+    risks, returns = frontier[:, 0], frontier[:, 1]
+    sharpes = np.divide(returns - risk_free_rate, risks, out=np.zeros_like(returns), where=risks > 0)
 
     # Tìm danh mục Sharpe tối đa
-    max_sharpe_idx = np.argmax(results[2])
-    max_sharpe_return = results[0, max_sharpe_idx]
-    max_sharpe_risk = results[1, max_sharpe_idx]
+    max_sharpe_idx = np.argmax(sharpes)
+    max_sharpe_return = returns[max_sharpe_idx]
+    max_sharpe_risk = risks[max_sharpe_idx]
 
     # Tìm danh mục rủi ro tối thiểu
-    min_risk_idx = np.argmin(results[1])
-    min_risk_return = results[0, min_risk_idx]
-    min_risk_risk = results[1, min_risk_idx]
+    min_risk_idx = np.argmin(risks)
+    min_risk_return = returns[min_risk_idx]
+    min_risk_risk = risks[min_risk_idx]
 
     plt.figure(figsize=(10, 7))
-    sc = plt.scatter(results[1, :], results[0, :], c=results[2, :], cmap='viridis', 
-                     marker='o', alpha=0.5)
+    plt.plot(risks, returns, 'k-', linewidth=1, alpha=0.5)
+    sc = plt.scatter(risks, returns, c=sharpes, cmap='viridis', marker='o')
     plt.colorbar(sc, label='Sharpe ratio')
 
     # Đánh dấu các danh mục đặc biệt
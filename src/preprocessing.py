@@ -0,0 +1,271 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Ngày nghỉ giao dịch của HOSE (chỉ các ngày thứ 2 - thứ 6): Tết Dương lịch, Tết Nguyên đán,
+# Giỗ Tổ Hùng Vương, 30/4 - 1/5, Quốc khánh 2/9 và các ngày nghỉ bù. Bổ sung khi có lịch năm mới.
+VN_HOLIDAYS = pd.DatetimeIndex([
+    # 2017
+    '2017-01-02', '2017-01-26', '2017-01-27', '2017-01-30', '2017-01-31', '2017-02-01',
+    '2017-04-06', '2017-05-01', '2017-05-02', '2017-09-04',
+    # 2018
+    '2018-01-01', '2018-02-14', '2018-02-15', '2018-02-16', '2018-02-19', '2018-02-20',
+    '2018-04-25', '2018-04-30', '2018-05-01', '2018-09-03', '2018-12-31',
+    # 2019
+    '2019-01-01', '2019-02-04', '2019-02-05', '2019-02-06', '2019-02-07', '2019-02-08',
+    '2019-04-15', '2019-04-29', '2019-04-30', '2019-05-01', '2019-09-02',
+    # 2020
+    '2020-01-01', '2020-01-23', '2020-01-24', '2020-01-27', '2020-01-28', '2020-01-29',
+    '2020-04-02', '2020-04-30', '2020-05-01', '2020-09-02',
+    # 2021
+    '2021-01-01', '2021-02-10', '2021-02-11', '2021-02-12', '2021-02-15', '2021-02-16',
+    '2021-04-21', '2021-04-30', '2021-05-03', '2021-09-02', '2021-09-03',
+    # 2022
+    '2022-01-03', '2022-01-31', '2022-02-01', '2022-02-02', '2022-02-03', '2022-02-04',
+    '2022-04-11', '2022-05-02', '2022-05-03', '2022-09-01', '2022-09-02',
+    # 2023
+    '2023-01-02', '2023-01-20', '2023-01-23', '2023-01-24', '2023-01-25', '2023-01-26',
+    '2023-05-01', '2023-05-02', '2023-05-03', '2023-09-01', '2023-09-04',
+    # 2024
+    '2024-01-01', '2024-02-08', '2024-02-09', '2024-02-12', '2024-02-13', '2024-02-14',
+    '2024-04-18', '2024-04-29', '2024-04-30', '2024-05-01', '2024-09-02', '2024-09-03',
+    # 2025
+    '2025-01-01', '2025-01-27', '2025-01-28', '2025-01-29', '2025-01-30', '2025-01-31',
+    '2025-04-07', '2025-04-30', '2025-05-01', '2025-05-02', '2025-09-01', '2025-09-02',
+])
+
+
+class TradingCalendar:
+    """
+    Lịch phiên giao dịch: các ngày trong weekmask trừ các ngày nghỉ lễ.
+    holidays=() cho lịch chỉ gồm các ngày thứ 2 - thứ 6 (như process_history cũ).
+    """
+
+    def __init__(self, holidays=VN_HOLIDAYS, weekmask='Mon Tue Wed Thu Fri'):
+        self.holidays = pd.DatetimeIndex(holidays)
+        self.weekmask = weekmask
+
+    @classmethod
+    def from_history(cls, df, weekmask='Mon Tue Wed Thu Fri', date_col='transaction_date'):
+        """Suy ra ngày nghỉ từ dữ liệu: các ngày trong tuần mà không mã nào có giao dịch"""
+        dates = pd.DatetimeIndex(pd.to_datetime(df[date_col]).unique())
+        all_days = pd.bdate_range(dates.min(), dates.max(), freq='C', weekmask=weekmask)
+        return cls(holidays=all_days.difference(dates), weekmask=weekmask)
+
+    def sessions(self, start, end):
+        """Các phiên giao dịch trong đoạn [start, end]"""
+        return pd.bdate_range(start, end, freq='C', weekmask=self.weekmask, holidays=list(self.holidays))
+
+    def is_session(self, dates):
+        """Mảng bool: ngày nào là phiên giao dịch"""
+        dates = pd.DatetimeIndex(pd.to_datetime(dates)).normalize()
+        return np.asarray(self.sessions(dates.min(), dates.max()).get_indexer(dates) >= 0)
+
+
+def fill_history(df, calendar=None, date_col='transaction_date', code_col='stock_code'):
+    """
+    Bổ sung các phiên thiếu cho tất cả các mã trong một lần: mỗi mã được đưa lên lưới phiên giao dịch
+    của calendar (từ ngày đầu đến ngày cuối của mã đó), giá trị thiếu được forward-fill theo từng mã,
+    các dòng được thêm vào có is_history = 1, dòng gốc có is_history = 0.
+    Dòng gốc rơi vào ngày không có trong lịch vẫn được giữ nguyên.
+
+    Parameters:
+    -----------
+    df : pandas DataFrame
+        Dữ liệu dạng dài của nhiều mã (cột code_col, date_col)
+    calendar : TradingCalendar
+        Lịch giao dịch (mặc định: thứ 2 - thứ 6 trừ VN_HOLIDAYS)
+
+    Returns:
+    --------
+    DataFrame đã bổ sung, sắp xếp theo (code_col, date_col)
+    """
+    calendar = calendar or TradingCalendar()
+    df = df.copy()
+    df[date_col] = pd.to_datetime(df[date_col])
+    df['is_history'] = 0
+    columns = list(df.columns)
+
+    bounds = df.groupby(code_col, sort=True)[date_col].agg(['min', 'max'])
+    sessions = calendar.sessions(bounds['min'].min(), bounds['max'].max())
+
+    # Đoạn phiên [lo, hi) của từng mã ghép thành một mảng vị trí, không lặp theo mã
+    lo = sessions.searchsorted(bounds['min'].to_numpy(), side='left')
+    hi = sessions.searchsorted(bounds['max'].to_numpy(), side='right')
+    counts = hi - lo
+    positions = np.arange(counts.sum()) + np.repeat(lo - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    grid = pd.DataFrame({code_col: np.repeat(bounds.index.to_numpy(), counts), date_col: sessions[positions]})
+
+    out = grid.merge(df, on=[code_col, date_col], how='outer', sort=False)
+    out = out.sort_values([code_col, date_col], kind='stable').reset_index(drop=True)
+    out['is_history'] = out['is_history'].fillna(1).astype(int)
+
+    value_columns = [c for c in columns if c not in (code_col, date_col, 'is_history')]
+    out[value_columns] = out.groupby(code_col, sort=False)[value_columns].ffill()
+    return out[columns]
+
+
+def clean_universe(df, calendar=None, start_date='2017-01-01', end_date='2024-12-31', min_rows=400,
+                   clean_fn=None, date_col='transaction_date', code_col='stock_code'):
+    """
+    Làm sạch toàn bộ các mã trong một lần: lọc khoảng thời gian, bỏ các mã có ít hơn min_rows phiên,
+    bổ sung phiên thiếu (fill_history) rồi áp dụng clean_fn(DataFrame của một mã) cho từng mã
+    (ví dụ xử lý thiếu / ngoại lệ). Kết quả được nối một lần thay vì pd.concat dần trong vòng lặp.
+    """
+    df = df.copy()
+    df[date_col] = pd.to_datetime(df[date_col])
+    df = df[(df[date_col] >= start_date) & (df[date_col] <= end_date)]
+
+    counts = df.groupby(code_col).size()
+    df = df[df[code_col].isin(counts.index[counts >= min_rows])]
+    if df.empty:
+        return df
+
+    df = fill_history(df, calendar, date_col, code_col)
+    if clean_fn is None:
+        return df
+
+    parts = []
+    for stock_code, group in df.groupby(code_col, sort=False):
+        cleaned = clean_fn(group.reset_index(drop=True))
+        cleaned[code_col] = stock_code
+        parts.append(cleaned)
+    return pd.concat(parts, ignore_index=True)
+
+
+def _fill_price(values):
+    """Nội suy tuyến tính rồi ffill / bfill (như bước đầu của process_missing_data)"""
+    return pd.Series(values).interpolate(method='linear').ffill().bfill().to_numpy()
+
+
+def series_hash(values, periods):
+    """Mã băm của chuỗi giá + chu kỳ, dùng làm khóa cache phân rã"""
+    h = hashlib.sha1(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    h.update(repr(tuple(periods)).encode())
+    return h.hexdigest()
+
+
+def decompose(values, periods=(5,)):
+    """
+    Phân rã MSTL một chuỗi giá không có NaN.
+
+    Returns:
+    --------
+    (seasonal, resid): tổng các thành phần mùa vụ và phần dư, mảng cùng độ dài với values
+    """
+    from statsmodels.tsa.seasonal import MSTL
+
+    res = MSTL(pd.Series(values), periods=list(periods)).fit()
+    seasonal = np.asarray(res.seasonal, dtype=float)
+    if seasonal.ndim == 2:
+        seasonal = seasonal.sum(axis=1)
+    return seasonal, np.asarray(res.resid, dtype=float)
+
+
+def _decompose_job(args):
+    values, periods = args
+    return decompose(values, periods)
+
+
+def decompose_many(series, periods=(5,), cache_dir=None, max_workers=None):
+    """
+    Phân rã MSTL nhiều chuỗi song song (ProcessPoolExecutor). Với cache_dir, kết quả được lưu theo
+    mã băm của chuỗi (<cache_dir>/<hash>.npz) nên các mã không đổi được bỏ qua khi chạy lại.
+
+    Parameters:
+    -----------
+    series : dict
+        Dictionary {mã: mảng giá không có NaN}
+
+    Returns:
+    --------
+    Dictionary {mã: (seasonal, resid)}
+    """
+    results, pending = {}, {}
+    for stock_code, values in series.items():
+        key = series_hash(values, periods)
+        path = os.path.join(cache_dir, f'{key}.npz') if cache_dir else None
+        if path and os.path.exists(path):
+            with np.load(path) as cached:
+                results[stock_code] = (cached['seasonal'], cached['resid'])
+        else:
+            pending[stock_code] = (values, path)
+
+    if pending:
+        print(f"Phân rã MSTL {len(pending)} mã ({len(results)} mã lấy từ cache)")
+        codes = list(pending)
+        jobs = [(pending[code][0], tuple(periods)) for code in codes]
+        if max_workers == 1 or len(jobs) == 1:
+            outputs = [_decompose_job(job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                outputs = list(executor.map(_decompose_job, jobs, chunksize=8))
+
+        for stock_code, (seasonal, resid) in zip(codes, outputs):
+            results[stock_code] = (seasonal, resid)
+            path = pending[stock_code][1]
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = path[:-len('.npz')] + '.tmp.npz'
+                np.savez(tmp_path, seasonal=seasonal, resid=resid)
+                os.replace(tmp_path, path)
+    return results
+
+
+def clean_price(data, seasonal, resid, alpha=3, price_col='closing_price'):
+    """
+    Xử lý thiếu và ngoại lệ của một mã bằng một phân rã MSTL duy nhất (của chuỗi giá đã nội suy):
+    ngoại lệ là các điểm có phần dư ngoài [Q1 - alpha * IQR, Q3 + alpha * IQR]; giá thiếu và giá ngoại lệ
+    được nội suy trên chuỗi đã khử mùa vụ rồi cộng lại thành phần mùa vụ, làm tròn 1 chữ số.
+    Thêm các cột resid, lower, upper, is_outlier, original_price như process_outlier_data.
+    """
+    data = data.copy()
+    price = data[price_col].to_numpy(dtype=float)
+    q1, q3 = np.quantile(resid, [0.25, 0.75])
+    iqr = q3 - q1
+
+    data['resid'] = resid
+    data['lower'] = q1 - alpha * iqr
+    data['upper'] = q3 + alpha * iqr
+    data['is_outlier'] = (resid < data['lower'].to_numpy()) | (resid > data['upper'].to_numpy())
+    data['original_price'] = np.round(_fill_price(price), 1)
+
+    deseasonal = price - seasonal
+    deseasonal[data['is_outlier'].to_numpy()] = np.nan
+    data[price_col] = np.round(_fill_price(deseasonal) + seasonal, 1)
+    return data
+
+
+def clean_universe_mstl(df, periods=(5,), alpha=3, cache_dir=None, max_workers=None,
+                        price_col='closing_price', code_col='stock_code'):
+    """
+    Thay cho process_missing_data + process_outlier_data trên toàn bộ các mã: mỗi mã chỉ phân rã MSTL
+    một lần (song song, có cache theo mã băm chuỗi), rồi dùng chung phân rã đó cho nội suy và xử lý ngoại lệ.
+
+    Parameters:
+    -----------
+    df : pandas DataFrame
+        Dữ liệu dạng dài đã bổ sung phiên thiếu (fill_history), sắp xếp theo (mã, ngày)
+    cache_dir : str
+        Thư mục cache phân rã (None: không cache)
+    max_workers : int
+        Số tiến trình (1: chạy tuần tự)
+
+    Returns:
+    --------
+    DataFrame đã làm sạch
+    """
+    groups = {stock_code: group.reset_index(drop=True) for stock_code, group in df.groupby(code_col, sort=False)}
+    series = {stock_code: _fill_price(group[price_col].to_numpy(dtype=float)) for stock_code, group in groups.items()}
+    decompositions = decompose_many(series, periods, cache_dir, max_workers)
+
+    parts = []
+    for stock_code, group in groups.items():
+        seasonal, resid = decompositions[stock_code]
+        cleaned = clean_price(group, seasonal, resid, alpha, price_col)
+        print(f"{stock_code}: {int(group[price_col].isna().sum())} giá thiếu, {int(cleaned['is_outlier'].sum())} ngoại lệ")
+        parts.append(cleaned)
+    return pd.concat(parts, ignore_index=True)
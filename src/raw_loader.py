@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Các giá trị trống trong file cào về
+NA_VALUES = ['--', '-', 'N/A', 'NaN', '']
+
+# Schema file lịch sử giao dịch đã ghép (transaction_history.csv):
+#   category - chuỗi lặp lại nhiều (mã, tên công ty)
+#   date     - ngày theo date_format
+#   float    - số thực (dấu ',' phân cách hàng nghìn) -> float32
+#   int      - số nguyên (khối lượng, số lệnh) -> int32 / float32 nếu có giá trị thiếu (xem _downcast_int)
+#   percent  - '12.5%' -> float32
+#   change   - 'x(y %)' -> hai cột <tên>_value, <tên>_percent (float32)
+TRANSACTION_SCHEMA = {
+    'stock_code': 'category',
+    'transaction_date': 'date',
+    'closing_price': 'float',
+    'adjusted_price': 'float',
+    'change_hisCost': 'change',
+    'matched_volume': 'int',
+    'matched_value': 'float',
+    'negotiated_volume': 'int',
+    'negotiated_value': 'float',
+    'opening_price': 'float',
+    'highest_price': 'float',
+    'lowest_price': 'float',
+    'company_name_foriegnBlock': 'category',
+    'change_foriegnBlock': 'change',
+    'foreign_net_volume': 'int',
+    'foreign_net_value': 'float',
+    'foreign_buy_volume': 'int',
+    'foreign_buy_value': 'float',
+    'foreign_sell_volume': 'int',
+    'foreign_sell_value': 'float',
+    'remaining_room': 'int',
+    'foreign_ownership': 'percent',
+    'change_orderStat': 'change',
+    'buy_orders': 'int',
+    'buy_volume': 'int',
+    'avg_buy_volume_per_order': 'float',
+    'sell_orders': 'int',
+    'sell_volume': 'int',
+    'avg_sell_volume_per_order': 'float',
+    'net_volume': 'int',
+    'proprietary_buy_volume': 'int',
+    'proprietary_buy_value': 'float',
+    'proprietary_sell_volume': 'int',
+    'proprietary_sell_value': 'float',
+    'proprietary_net_volume': 'int',
+    'proprietary_net_value': 'float',
+}
+
+CHANGE_PATTERN = r'^(-?\d+(?:\.\d+)?)\((-?\d+(?:\.\d+)?)%\)$'
+
+
+def parse_dates(values, date_format='%d/%m/%Y'):
+    """Parse ngày theo định dạng cố định; mỗi chuỗi ngày khác nhau chỉ parse một lần"""
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), format=date_format, errors='coerce').to_numpy()
+    return np.where(codes >= 0, parsed[np.maximum(codes, 0)], np.datetime64('NaT', 'ns'))
+
+
+def _parse_change(values):
+    """Tách 'x(y %)' thành (x, y) float32; chuỗi lặp lại nhiều nên chỉ tách trên các giá trị khác nhau"""
+    codes, uniques = pd.factorize(values)
+    parts = pd.Series(uniques, dtype=object).str.replace(r'\s+', '', regex=True).str.extract(CHANGE_PATTERN)
+    parts = parts.astype(np.float32).to_numpy()
+    parts = np.vstack([parts, np.full((1, 2), np.nan, dtype=np.float32)])
+    return parts[codes, 0], parts[codes, 1]
+
+
+def _to_number(series):
+    """Cột đã được read_csv parse thành số thì giữ nguyên, còn lại bỏ ',' / '%' rồi chuyển sang số"""
+    if series.dtype.kind in 'iuf':
+        return series.astype(float)
+    cleaned = series.astype(str).str.replace(',', '', regex=False).str.replace('%', '', regex=False).str.strip()
+    return pd.to_numeric(cleaned, errors='coerce')
+
+
+def _downcast_int(series):
+    """
+    Cột số nguyên: không thiếu -> int32 (int64 nếu vượt phạm vi);
+    có giá trị thiếu -> float32 nếu mọi giá trị biểu diễn chính xác được (|x| <= 2^24), ngược lại float64.
+    """
+    values = series.to_numpy(dtype=float)
+    finite = values[~np.isnan(values)]
+    largest = np.abs(finite).max() if len(finite) else 0
+    if len(finite) == len(values) and np.all(finite == np.round(finite)):
+        return series.astype(np.int32 if largest <= np.iinfo(np.int32).max else np.int64)
+    return series.astype(np.float32 if largest <= 2 ** 24 else np.float64)
+
+
+def _convert_chunk(chunk, schema, date_format):
+    out = {}
+    for column, kind in schema.items():
+        if column not in chunk.columns:
+            continue
+        values = chunk[column]
+        if kind == 'category':
+            # Chỉ strip các giá trị có mặt, giữ NaN (astype(str) biến NaN thành chuỗi 'nan')
+            out[column] = values.astype(str).str.strip().where(values.notna()).astype('category')
+        elif kind == 'date':
+            out[column] = parse_dates(values, date_format)
+        elif kind == 'float' or kind == 'percent':
+            out[column] = _to_number(values).astype(np.float32)
+        elif kind == 'int':
+            out[column] = _downcast_int(_to_number(values))
+        elif kind == 'change':
+            out[f'{column}_value'], out[f'{column}_percent'] = _parse_change(values)
+        else:
+            raise ValueError(f"Kiểu '{kind}' của cột {column} không hợp lệ")
+    return pd.DataFrame(out, index=chunk.index)
+
+
+def load_raw_csv(csv_path, schema=None, date_format='%d/%m/%Y', chunksize=200_000, drop_invalid_dates=True):
+    """
+    Đọc file CSV thô theo schema, xử lý từng khối: số có dấu phân cách hàng nghìn và giá trị trống
+    ('--', 'N/A', ...) được read_csv parse ngay khi đọc, phần trăm và chuỗi 'x(y %)' được tách bằng phép
+    toán vector trên cả khối. Chỉ đọc các cột có trong schema.
+
+    Parameters:
+    -----------
+    csv_path : str
+        Đường dẫn file CSV (ví dụ transaction_history.csv)
+    schema : dict
+        {cột: kiểu} (mặc định TRANSACTION_SCHEMA)
+    date_format : str
+        Định dạng ngày (không đoán dayfirst)
+    chunksize : int
+        Số dòng mỗi khối
+
+    Returns:
+    --------
+    DataFrame: stock_code dạng category, số float32 / int32, ngày datetime64
+    """
+    schema = schema or TRANSACTION_SCHEMA
+    header = pd.read_csv(csv_path, nrows=0).columns
+    usecols = [c for c in header if c in schema]
+    text_columns = {c: str for c in usecols if schema[c] in ('category', 'date', 'percent', 'change')}
+
+    chunks = []
+    reader = pd.read_csv(csv_path, usecols=usecols, dtype=text_columns, thousands=',', na_values=NA_VALUES,
+                         keep_default_na=True, chunksize=chunksize)
+    date_columns = [c for c in usecols if schema[c] == 'date']
+    for chunk in reader:
+        chunk = _convert_chunk(chunk, schema, date_format)
+        if drop_invalid_dates and date_columns:
+            chunk = chunk.dropna(subset=date_columns)
+        chunks.append(chunk)
+    if not chunks:
+        return pd.DataFrame(columns=usecols)
+
+    # Ghép từng cột một và giải phóng cột đó ở các khối ngay sau khi ghép (không giữ hai bản cả bảng);
+    # category gộp bằng union_categoricals, cột số nguyên chọn kiểu cuối cùng trên toàn bộ dữ liệu
+    columns = list(chunks[0].columns)
+    data = {}
+    for column in columns:
+        parts = [chunk.pop(column) for chunk in chunks]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            data[column] = union_categoricals(parts)
+        else:
+            values = pd.Series(np.concatenate([part.to_numpy() for part in parts]))
+            data[column] = _downcast_int(values) if schema.get(column) == 'int' else values
+        del parts
+    del chunks
+    return pd.DataFrame(data, copy=False)
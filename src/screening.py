@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+
+# Chuyển lịch sử giao dịch dạng dài (stock_code, transaction_date, ...) thành ma trận (ngày x mã)
+def pivot_market(df, columns=('closing_price', 'matched_volume'),
+                 start_time=None, end_time=None):
+    """
+    Pivot dữ liệu giao dịch đã xử lý thành các ma trận căn chỉnh theo ngày.
+
+    Parameters:
+    -----------
+    df : pandas DataFrame
+        Lịch sử giao dịch dạng dài, có cột 'stock_code' và 'transaction_date'
+    columns : list
+        Các cột cần pivot (bỏ qua cột không có trong df). Mặc định chỉ các cột compute_screening_metrics
+        dùng; giá trị giao dịch được tính từ giá x khối lượng nên không cần pivot matched_value
+    start_time, end_time : str
+        Khoảng thời gian [start_time, end_time)
+
+    Returns:
+    --------
+    Dictionary {tên cột: DataFrame (ngày x mã)}
+    """
+    columns = [col for col in columns if col in df.columns]
+
+    # Mã hóa mã CK và ngày thành số nguyên một lần; chỉ parse các ngày duy nhất
+    code_idx, codes = pd.factorize(df['stock_code'], sort=True)
+    date_idx, dates = pd.factorize(df['transaction_date'])
+    dates = pd.to_datetime(dates)
+
+    # Bỏ các dòng thiếu mã CK hoặc ngày
+    valid_rows = (code_idx >= 0) & (date_idx >= 0)
+    code_idx, date_idx = code_idx[valid_rows], date_idx[valid_rows]
+    order = np.argsort(dates.to_numpy())
+    date_rank = np.empty_like(order)
+    date_rank[order] = np.arange(len(order))
+    date_idx = date_rank[date_idx]
+    dates = dates[order]
+
+    keep = np.ones(len(dates), dtype=bool)
+    if start_time is not None:
+        keep &= dates >= pd.Timestamp(start_time)
+    if end_time is not None:
+        keep &= dates < pd.Timestamp(end_time)
+    index = pd.DatetimeIndex(dates[keep], name='transaction_date')
+    columns_index = pd.Index(codes, name='stock_code')
+
+    # Ghi trực tiếp giá trị vào ma trận (ngày x mã); trùng (mã, ngày) thì lấy dòng sau cùng
+    result = {}
+    for col in columns:
+        matrix = np.full((len(dates), len(codes)), np.nan)
+        matrix[date_idx, code_idx] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)[valid_rows]
+        result[col] = pd.DataFrame(matrix[keep], index=index, columns=columns_index)
+    return result
+
+
+def _parse_market_cap(market_cap):
+    """Chuẩn hóa vốn hóa về Series số theo stock_code (bỏ dấu ',' nếu là chuỗi)"""
+    if isinstance(market_cap, pd.DataFrame):
+        market_cap = market_cap.set_index('stock_code')['market_cap']
+    return pd.to_numeric(market_cap.astype(str).str.replace(',', '', regex=False), errors='coerce')
+
+
+def compute_screening_metrics(market, confidence=0.95, periods_per_year=252):
+    """
+    Tính các chỉ số sàng lọc cho tất cả các mã cùng lúc trên ma trận (ngày x mã):
+      - var_historical: VaR lịch sử (phân vị lợi nhuận), số dương = mức lỗ
+      - var_parametric: VaR tham số theo phân phối chuẩn
+      - cagr: tốc độ tăng trưởng kép hằng năm giữa giá đầu tiên và cuối cùng
+      - avg_volume, avg_traded_value: khối lượng và giá trị giao dịch trung bình
+      - trading_ratio: tỷ lệ phiên có giao dịch (khối lượng > 0)
+    """
+    prices = market['closing_price']
+    values = prices.to_numpy()
+    dates = prices.index.to_numpy()
+
+    # Lợi nhuận theo ngày (bỏ qua phiên thiếu giá)
+    returns = values[1:] / values[:-1] - 1
+    returns[~np.isfinite(returns)] = np.nan
+
+    var_historical = -np.nanquantile(returns, 1 - confidence, axis=0)
+    mean = np.nanmean(returns, axis=0)
+    std = np.nanstd(returns, axis=0, ddof=1)
+    var_parametric = -(mean + norm.ppf(1 - confidence) * std)
+
+    # CAGR: giá hợp lệ đầu tiên và cuối cùng của từng mã
+    valid = ~np.isnan(values)
+    first_idx = valid.argmax(axis=0)
+    last_idx = len(values) - 1 - valid[::-1].argmax(axis=0)
+    columns = np.arange(values.shape[1])
+    first_price = values[first_idx, columns]
+    last_price = values[last_idx, columns]
+    years = (dates[last_idx] - dates[first_idx]) / np.timedelta64(1, 'D') / 365.25
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cagr = np.where((years > 0) & (first_price > 0), (last_price / first_price) ** (1 / years) - 1, np.nan)
+
+    metrics = pd.DataFrame({
+        'var_historical': var_historical,
+        'var_parametric': var_parametric,
+        'cagr': cagr,
+        'mean_return': mean,
+        'volatility': std * np.sqrt(periods_per_year),
+        'num_days': valid.sum(axis=0),
+    }, index=prices.columns)
+
+    if 'matched_volume' in market:
+        volume = market['matched_volume'].to_numpy()
+        metrics['avg_volume'] = np.nanmean(volume, axis=0)
+        metrics['trading_ratio'] = (np.nan_to_num(volume) > 0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+        # Giá trị giao dịch = giá đóng cửa x khối lượng khớp lệnh
+        metrics['avg_traded_value'] = np.nanmean(values * volume, axis=0)
+
+    metrics.index.name = 'stock_code'
+    return metrics
+
+
+def screen_stocks(df, market_cap=None, start_time=None, end_time=None,
+                  confidence=0.95, periods_per_year=252,
+                  min_avg_volume=None, min_avg_traded_value=None, min_trading_ratio=None,
+                  min_market_cap=None, max_var=None, min_cagr=None,
+                  rank_by='cagr', ascending=False, top_n=None):
+    """
+    Lọc và xếp hạng toàn bộ thị trường theo khối lượng, vốn hóa, VaR và CAGR.
+
+    Parameters:
+    -----------
+    df : pandas DataFrame
+        Lịch sử giao dịch đã xử lý (dạng dài) cho nhiều mã
+    market_cap : pandas Series hoặc DataFrame (stock_code, market_cap), tùy chọn
+    min_avg_volume, min_avg_traded_value, min_trading_ratio, min_market_cap : float
+        Ngưỡng thanh khoản / vốn hóa tối thiểu (None = không lọc)
+    max_var : float
+        VaR lịch sử tối đa cho phép (ví dụ 0.05 = lỗ tối đa 5%/phiên ở mức tin cậy confidence)
+    min_cagr : float
+        CAGR tối thiểu
+    rank_by : str
+        Cột dùng để xếp hạng
+    top_n : int
+        Chỉ giữ top_n mã sau khi xếp hạng
+
+    Returns:
+    --------
+    DataFrame các mã vượt qua bộ lọc, đã sắp xếp, kèm cột 'rank'
+    """
+    market = pivot_market(df, start_time=start_time, end_time=end_time)
+    metrics = compute_screening_metrics(market, confidence=confidence, periods_per_year=periods_per_year)
+
+    if market_cap is not None:
+        metrics['market_cap'] = _parse_market_cap(market_cap).reindex(metrics.index)
+
+    mask = pd.Series(True, index=metrics.index)
+    filters = [
+        ('avg_volume', min_avg_volume, 'min'),
+        ('avg_traded_value', min_avg_traded_value, 'min'),
+        ('trading_ratio', min_trading_ratio, 'min'),
+        ('market_cap', min_market_cap, 'min'),
+        ('var_historical', max_var, 'max'),
+        ('cagr', min_cagr, 'min'),
+    ]
+    for column, threshold, kind in filters:
+        if threshold is None:
+            continue
+        if column not in metrics:
+            raise ValueError(f"Không có dữ liệu cho cột '{column}' để lọc")
+        mask &= metrics[column] >= threshold if kind == 'min' else metrics[column] <= threshold
+
+    result = metrics[mask].sort_values(rank_by, ascending=ascending, na_position='last')
+    if top_n is not None:
+        result = result.head(top_n)
+    result['rank'] = np.arange(1, len(result) + 1)
+    return result
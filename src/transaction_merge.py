@@ -0,0 +1,216 @@
+import os
+import numpy as np
+import pandas as pd
+
+KEY_COLUMNS = ['stock_code', 'transaction_date']
+
+# Cấu hình từng nguồn lịch sử giao dịch: đổi tên cột (tiếng Việt -> tên chuẩn, các cột trùng tên giữa
+# các nguồn được gắn hậu tố như khi merge), cột bỏ đi và các giá trị header lặp lại trong file cần loại bỏ
+SOURCES = {
+    'his_cost': {
+        'rename': {
+            "Stock_code": "stock_code",
+            "Ngày": "transaction_date",
+            "Giá đóng cửa": "closing_price",
+            "Giá điều chỉnh": "adjusted_price",
+            "Thay đổi": "change_hisCost",
+            "Khối lượng khớp lệnh": "matched_volume",
+            "Giá trị khớp lệnh": "matched_value",
+            "Khối lượng thỏa thuận": "negotiated_volume",
+            "Giá trị thỏa thuận": "negotiated_value",
+            "Giá mở cửa": "opening_price",
+            "Giá cao nhất": "highest_price",
+            "Giá thấp nhất": "lowest_price",
+        },
+        'drop': ["Tên công ty"],
+        'header_values': {'Ngày': ['Ngày', 'Đóng cửa']},
+    },
+    'foreign_block': {
+        'rename': {
+            "Stock_code": "stock_code",
+            "Tên công ty": "company_name_foriegnBlock",
+            "Ngày": "transaction_date",
+            "Thay đổi": "change_foriegnBlock",
+            "Giao dịch ròng - Khối lượng": "foreign_net_volume",
+            "Giao dịch ròng - Giá trị (tỷ VNĐ)": "foreign_net_value",
+            "Mua - Khối lượng": "foreign_buy_volume",
+            "Mua - Giá trị (tỷ VNĐ)": "foreign_buy_value",
+            "Bán - Khối lượng": "foreign_sell_volume",
+            "Bán - Giá trị (tỷ VNĐ)": "foreign_sell_value",
+            "Room còn lại": "remaining_room",
+            "Đang sở hữu": "foreign_ownership",
+        },
+        'drop': [],
+        'header_values': {'Ngày': ['Ngày', 'Khối lượng']},
+    },
+    'order_stat': {
+        'rename': {
+            "Stock_code": "stock_code",
+            "Ngày": "transaction_date",
+            "Thay đổi": "change_orderStat",
+            "Số lệnh Mua": "buy_orders",
+            "Khối lượng Mua": "buy_volume",
+            "KLTB 1 lệnh Mua": "avg_buy_volume_per_order",
+            "Số lệnh Bán": "sell_orders",
+            "Khối lượng Bán": "sell_volume",
+            "KLTB 1 lệnh Bán": "avg_sell_volume_per_order",
+            "Khối lượng ròng": "net_volume",
+        },
+        'drop': ["Tên công ty"],
+        'header_values': {'Ngày': ['Ngày', 'Số lệnh']},
+    },
+    'self_employ': {
+        'rename': {
+            "Stock_code": "stock_code",
+            "Ngày": "transaction_date",
+            "Khối lượng mua": "proprietary_buy_volume",
+            "Giá trị mua(tỷ VND)": "proprietary_buy_value",
+            "Khối lượng bán": "proprietary_sell_volume",
+            "Giá trị bán(tỷ VND)": "proprietary_sell_value",
+            "Giá trị ròng_Khối lượng": "proprietary_net_volume",
+            "Giá trị ròng_giá trị(Tỷ VND)": "proprietary_net_value",
+        },
+        'drop': ["Tên công ty", "Mã"],
+        'header_values': {'Mã': ['Mã', 'Khối lượng', 'KHÔNG CÓ KẾT QUẢ PHÙ HỢP']},
+    },
+}
+
+
+def prepare_source(df, source, date_format='%d/%m/%Y'):
+    """
+    Chuẩn hóa một file nguồn thô: bỏ các dòng header lặp lại, đổi tên cột, parse ngày theo date_format
+    (một định dạng cố định, không đoán dayfirst), bỏ khoảng trắng ở mã, loại dòng ngày lỗi và khóa trùng
+    (giữ dòng cuối).
+
+    Returns:
+    --------
+    (DataFrame có index (stock_code, transaction_date) đã sắp xếp, số dòng ngày lỗi, số khóa trùng)
+    """
+    config = SOURCES[source]
+    for column, values in config['header_values'].items():
+        if column in df.columns:
+            df = df[~df[column].isin(values)]
+    df = df.drop(columns=[c for c in config['drop'] if c in df.columns])
+    df = df.rename(columns=config['rename'])
+    df = df.drop(columns=[c for c in df.columns if str(c).startswith('Unnamed')])
+
+    df['stock_code'] = df['stock_code'].astype(str).str.strip()
+    # Mỗi ngày lặp lại ở mọi mã -> chỉ parse các chuỗi ngày khác nhau
+    codes, uniques = pd.factorize(df['transaction_date'])
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), format=date_format, errors='coerce').to_numpy()
+    df['transaction_date'] = np.where(codes >= 0, parsed[codes], np.datetime64('NaT'))
+    invalid = int(df['transaction_date'].isna().sum())
+    df = df.dropna(subset=['transaction_date'])
+
+    duplicated = df.duplicated(subset=KEY_COLUMNS, keep='last')
+    df = df[~duplicated]
+    return df.set_index(KEY_COLUMNS).sort_index(), invalid, int(duplicated.sum())
+
+
+class TransactionMaster:
+    """
+    Bảng lịch sử giao dịch tổng hợp, index (stock_code, transaction_date), lưu dưới dạng Parquet.
+    Mỗi nguồn được upsert vào bảng: khóa mới được thêm, khóa đã có chỉ ghi lại các dòng có giá trị thay đổi,
+    nên cập nhật hằng ngày chỉ chạm tới các khóa mới thay vì merge lại toàn bộ các nguồn.
+    Các dòng mới được nối vào cuối bảng (không sắp xếp lại ở mỗi lần upsert); bảng chỉ được sắp xếp một lần
+    khi cần đọc ra (to_frame, missing_keys, save).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        if path and os.path.exists(path):
+            self.data = pd.read_parquet(path)
+        else:
+            self.data = pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []], names=KEY_COLUMNS))
+        self.reports = []
+        self._sorted = self.data.index.is_monotonic_increasing
+
+    def upsert(self, df, source):
+        """
+        Upsert DataFrame đã chuẩn hóa (index (stock_code, transaction_date)) của một nguồn.
+        Chỉ các khóa của df được đọc / ghi; phần còn lại của bảng không bị quét lại.
+
+        Returns:
+        --------
+        Dictionary báo cáo: rows, inserted (khóa mới), filled (khóa đã có, bổ sung các ô còn trống),
+        updated (khóa đã có, giá trị khác với bảng), unchanged, new_keys (các khóa mới - với nguồn thứ hai
+        trở đi là các khóa chưa có ở những nguồn trước), conflict_keys (các khóa bị ghi đè giá trị)
+        """
+        columns = list(df.columns)
+        for column in columns:
+            if column not in self.data.columns:
+                self.data[column] = pd.Series(np.nan, index=self.data.index, dtype=object)
+
+        positions = self.data.index.get_indexer(df.index)
+        exists = positions >= 0
+        rows = positions[exists]
+
+        # Khóa đã có: so sánh với giá trị trong bảng, chỉ ghi các ô thay đổi.
+        # Ô đang trống -> bổ sung (filled); ô đã có giá trị khác -> xung đột giữa các lần tải / nguồn (conflicts)
+        filled = np.zeros(len(rows), dtype=bool)
+        conflicts = np.zeros(len(rows), dtype=bool)
+        for column in columns:
+            old = self.data[column].iloc[rows].to_numpy(dtype=object)
+            new = df[column].to_numpy(dtype=object)[exists]
+            old_na, new_na = pd.isna(old), pd.isna(new)
+            changed = ~new_na & (old_na | (old != new))
+            if changed.any():
+                filled |= changed & old_na
+                conflicts |= changed & ~old_na
+                self.data.iloc[rows[changed], self.data.columns.get_loc(column)] = new[changed]
+
+        new_keys = df.index[~exists]
+        if len(new_keys):
+            # Đưa các dòng mới về đúng kiểu cột của bảng để concat không phải đổi kiểu cả bảng
+            new_rows = df.loc[~exists].reindex(columns=self.data.columns).astype(self.data.dtypes.to_dict())
+            # get_indexer vẫn đúng trên index chưa sắp xếp (khóa là duy nhất) -> để việc sắp xếp tới lúc đọc ra
+            self.data = pd.concat([self.data, new_rows])
+            self._sorted = False
+
+        report = {
+            'source': source,
+            'rows': len(df),
+            'inserted': len(new_keys),
+            'filled': int((filled & ~conflicts).sum()),
+            'updated': int(conflicts.sum()),
+            'unchanged': int((~filled & ~conflicts).sum()),
+            'new_keys': new_keys,
+            'conflict_keys': df.index[exists][conflicts],
+        }
+        self.reports.append(report)
+        return report
+
+    def upsert_csv(self, csv_path, source, date_format='%d/%m/%Y'):
+        """Đọc một file nguồn thô (giữ dạng chuỗi), chuẩn hóa và upsert; in báo cáo ngắn"""
+        df, invalid, duplicates = prepare_source(pd.read_csv(csv_path, dtype=str, low_memory=False), source, date_format)
+        report = self.upsert(df, source)
+        report['invalid_dates'] = invalid
+        report['duplicates'] = duplicates
+        print(f"{source}: {report['rows']} dòng, thêm {report['inserted']}, bổ sung {report['filled']}, "
+              f"cập nhật {report['updated']}, không đổi {report['unchanged']}, "
+              f"ngày lỗi {invalid}, trùng khóa {duplicates}")
+        return report
+
+    def sort(self):
+        """Sắp xếp bảng theo (stock_code, transaction_date) nếu có dòng mới được thêm từ lần sắp xếp trước"""
+        if not self._sorted:
+            self.data = self.data.sort_index()
+            self._sorted = True
+        return self.data
+
+    def missing_keys(self, source):
+        """Các khóa trong bảng không có dữ liệu của nguồn (tương đương anti-join với các nguồn còn lại)"""
+        self.sort()
+        columns = [c for c in SOURCES[source]['rename'].values() if c in self.data.columns and c not in KEY_COLUMNS]
+        return self.data.index[self.data[columns].isna().all(axis=1).to_numpy()]
+
+    def to_frame(self):
+        return self.sort().reset_index()
+
+    def save(self, path=None):
+        """Ghi bảng ra Parquet (ghi file tạm rồi thay thế)"""
+        path = path or self.path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + '.tmp'
+        self.sort().to_parquet(tmp_path)
+        os.replace(tmp_path, path)
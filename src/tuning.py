@@ -0,0 +1,193 @@
+import json
+import os
+from itertools import product
+
+import numpy as np
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingGridSearchCV, ParameterGrid, TimeSeriesSplit
+
+# Lưới tham số XGBoost của xgboots (optimization_stock.ipynb). n_estimators không nằm trong lưới mà là
+# "tài nguyên" của successive halving: vòng đầu mọi tổ hợp chỉ được huấn luyện với ít cây, mỗi vòng chỉ
+# giữ lại 1/factor tổ hợp tốt nhất và tăng số cây lên factor lần.
+XGB_PARAM_GRID = {
+    'learning_rate': [0.01, 0.03, 0.05, 0.1],
+    'max_depth': [3, 4, 5, 7],
+    'subsample': [0.7, 0.8, 0.9],
+    'colsample_bytree': [0.5, 0.7],
+}
+
+# Ngưỡng độ biến động năm hóa để nhóm các mã có tính chất giống nhau (dùng chung tham số đã dò)
+VOLATILITY_EDGES = (0.2, 0.35, 0.5)
+
+
+def ticker_cluster(prices, periods_per_year=52, edges=VOLATILITY_EDGES):
+    """
+    Nhóm của một mã theo độ biến động năm hóa của log return (0: thấp nhất .. len(edges): cao nhất).
+    Các mã cùng nhóm dùng chung tham số tốt nhất trong TuningCache.
+    """
+    prices = np.asarray(prices, dtype=float)
+    prices = prices[np.isfinite(prices) & (prices > 0)]
+    if len(prices) < 3:
+        return 0
+    volatility = np.std(np.diff(np.log(prices))) * np.sqrt(periods_per_year)
+    return int(np.searchsorted(edges, volatility))
+
+
+def neighborhood_grid(best_params, param_grid=None, max_candidates=12, seed=0):
+    """
+    Các tổ hợp lân cận của best_params trong lưới: mỗi tham số lấy giá trị tốt nhất và các giá trị liền kề
+    trong lưới. Nếu nhiều hơn max_candidates tổ hợp thì chọn ngẫu nhiên (luôn giữ best_params).
+
+    Returns:
+    --------
+    List các dictionary {tham số: giá trị}
+    """
+    param_grid = XGB_PARAM_GRID if param_grid is None else param_grid
+    options = {}
+    for name, values in param_grid.items():
+        values = sorted(values)
+        if best_params.get(name) in values:
+            i = values.index(best_params[name])
+            options[name] = values[max(i - 1, 0):i + 2]
+        else:
+            options[name] = values
+
+    names = list(options)
+    best = {name: best_params.get(name, options[name][0]) for name in names}
+    candidates = [dict(zip(names, combo)) for combo in product(*(options[name] for name in names))]
+    candidates = [c for c in candidates if c != best]
+    if len(candidates) > max_candidates - 1:
+        rng = np.random.default_rng(seed)
+        picks = rng.choice(len(candidates), max_candidates - 1, replace=False)
+        candidates = [candidates[i] for i in sorted(picks)]
+    return [best] + candidates
+
+
+def make_xgb(random_state=0):
+    from xgboost import XGBRegressor
+
+    # Mỗi mô hình dùng 1 luồng, song song hóa ở mức tổ hợp tham số (n_jobs của search)
+    return XGBRegressor(n_jobs=1, random_state=random_state)
+
+
+def halving_search(X, y, candidates, estimator=None, n_splits=3, min_estimators=30, max_estimators=300,
+                   factor=3, n_jobs=-1):
+    """
+    Successive halving trên các fold TimeSeriesSplit (fold sau luôn đánh giá trên dữ liệu sau thời điểm train,
+    khác với cv=3 không theo thứ tự thời gian của GridSearchCV cũ), tài nguyên là n_estimators.
+
+    Parameters:
+    -----------
+    X, y : array
+        Dữ liệu train theo thứ tự thời gian
+    candidates : list
+        List các dictionary {tham số: giá trị} cần thử (ví dụ từ neighborhood_grid) hoặc một lưới dạng dict
+    estimator : object
+        Mô hình có tham số n_estimators (mặc định XGBRegressor)
+    n_jobs : int
+        Số tiến trình chạy song song các tổ hợp
+
+    Returns:
+    --------
+    HalvingGridSearchCV đã fit (best_params_ gồm cả n_estimators, best_estimator_ đã huấn luyện lại trên toàn bộ X)
+    """
+    if isinstance(candidates, dict):
+        param_grid = candidates
+    else:
+        param_grid = [{name: [value] for name, value in params.items()} for params in candidates]
+
+    # Ít tổ hợp (ví dụ khi khởi tạo từ cache) thì cần ít vòng hơn: nâng số cây của vòng đầu để vòng cuối
+    # vẫn huấn luyện với gần max_estimators cây
+    n_rounds = 1 + int(np.floor(np.log(max(len(ParameterGrid(param_grid)), 1)) / np.log(factor) + 1e-9))
+    min_estimators = max(min_estimators, max_estimators // factor ** (n_rounds - 1))
+
+    search = HalvingGridSearchCV(
+        estimator=estimator if estimator is not None else make_xgb(),
+        param_grid=param_grid,
+        factor=factor,
+        resource='n_estimators',
+        min_resources=min_estimators,
+        max_resources=max_estimators,
+        cv=TimeSeriesSplit(n_splits=n_splits),
+        scoring='neg_mean_squared_error',
+        n_jobs=n_jobs,
+        refit=True,
+    )
+    search.fit(X, y)
+    return search
+
+
+class TuningCache:
+    """
+    Tham số tốt nhất của từng mã theo (thành phần MSTL, nhóm mã), lưu dạng JSON.
+    Mã đầu tiên của một nhóm được dò trên toàn bộ lưới; các mã sau cùng nhóm chỉ dò quanh tham số
+    xuất hiện nhiều nhất trong nhóm (neighborhood_grid).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def _key(component, cluster):
+        return f'{component}|{cluster}'
+
+    def get(self, component, cluster, stock_code=None):
+        """
+        Tham số khởi tạo: tham số đã dò của chính mã đó nếu có, ngược lại bộ tham số tốt nhất chung của
+        nhiều mã nhất trong nhóm (bằng nhau thì lấy bộ mới nhất). Không so sánh score giữa các mã vì sai số
+        của các mã khác nhau không cùng thang đo.
+        """
+        tickers = self.entries.get(self._key(component, cluster))
+        if not tickers:
+            return None
+        if stock_code in tickers:
+            return tickers[stock_code]['params']
+        params = [json.dumps(entry['params'], sort_keys=True) for entry in tickers.values()]
+        counts = {p: params.count(p) for p in params}
+        best = max(reversed(params), key=lambda p: counts[p])
+        return json.loads(best)
+
+    def update(self, component, cluster, params, score, stock_code):
+        self.entries.setdefault(self._key(component, cluster), {})[stock_code] = {
+            'params': params, 'score': float(score)}
+
+    def save(self, path=None):
+        path = path or self.path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+def _to_builtin(params):
+    return {name: value.item() if isinstance(value, np.generic) else value for name, value in params.items()}
+
+
+def tune_model(X_train, y_train, component, cluster=0, cache=None, stock_code=None, param_grid=None,
+               estimator=None, n_splits=3, max_candidates=12, n_jobs=-1, verbose=True):
+    """
+    Dò tham số cho một thành phần của một mã: dò trên lưới đầy đủ nếu (component, cluster) chưa có trong
+    cache, ngược lại chỉ dò max_candidates tổ hợp quanh tham số đã lưu.
+
+    Returns:
+    --------
+    (mô hình tốt nhất đã huấn luyện trên X_train, tham số tốt nhất)
+    """
+    param_grid = XGB_PARAM_GRID if param_grid is None else param_grid
+    warm = cache.get(component, cluster, stock_code) if cache is not None else None
+    candidates = param_grid if warm is None else neighborhood_grid(warm, param_grid, max_candidates)
+
+    search = halving_search(X_train, y_train, candidates, estimator, n_splits=n_splits, n_jobs=n_jobs)
+    best_params = _to_builtin(search.best_params_)
+    if verbose:
+        n_fits = int(np.sum(search.n_candidates_)) * n_splits
+        print(f"{component} (nhóm {cluster}): {n_fits} lần fit, "
+              f"{'khởi tạo từ cache' if warm else 'lưới đầy đủ'}, best {best_params}, score {search.best_score_:.6f}")
+    if cache is not None and stock_code is not None:
+        cache.update(component, cluster, best_params, search.best_score_, stock_code)
+    return search.best_estimator_, best_params
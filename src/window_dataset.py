@@ -0,0 +1,252 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.preprocessing import StandardScaler
+
+
+def sequence_windows(X_scaled, sequence_length):
+    """
+    Cửa sổ X[i : i + sequence_length] với i = 0 .. len - sequence_length - 1 (như vòng lặp của
+    prepare_data, mục tiêu tương ứng là y[i + sequence_length]).
+    Trả về view (n_windows, sequence_length, num_features) trên X_scaled, không sao chép dữ liệu.
+    Lưu ý: np.array / torch.tensor / model.fit của Keras sẽ tạo bản sao đầy đủ
+    (n_windows * sequence_length * num_features) từ view này; để huấn luyện bằng torch mà không sao chép
+    từng cửa sổ hãy dùng WindowDataset.from_series.
+    """
+    X_scaled = np.asarray(X_scaled)
+    n_windows = len(X_scaled) - sequence_length
+    if n_windows <= 0:
+        return np.empty((0, sequence_length) + X_scaled.shape[1:], dtype=X_scaled.dtype)
+    return sliding_window_view(X_scaled, sequence_length, axis=0)[:n_windows].transpose(0, 2, 1)
+
+
+def scale_ticker(data, split_date='2024-01-01', target_column='closing_price', scaler_cls=StandardScaler):
+    """
+    Chuẩn hóa dữ liệu một mã như preprocess_data: scaler_x (mọi cột trừ transaction_date / stock_code)
+    và scaler_y (target_column) chỉ fit trên phần train (trước split_date), rồi transform cả chuỗi một lần.
+
+    Returns:
+    --------
+    Dictionary: features (T, F) float32, target (T,) float32, dates, n_train, scaler_x, scaler_y, columns
+    """
+    data = data.sort_values('transaction_date')
+    dates = pd.to_datetime(data['transaction_date']).to_numpy()
+    feature_frame = data.drop(columns=[c for c in ('transaction_date', 'stock_code') if c in data.columns])
+    n_train = int((dates < np.datetime64(pd.Timestamp(split_date))).sum())
+    if n_train == 0:
+        raise ValueError("Không có dữ liệu train trước split_date")
+
+    values = feature_frame.to_numpy(dtype=float)
+    target = data[target_column].to_numpy(dtype=float).reshape(-1, 1)
+    scaler_x = scaler_cls().fit(values[:n_train])
+    scaler_y = scaler_cls().fit(target[:n_train])
+    return {
+        'features': scaler_x.transform(values).astype(np.float32),
+        'target': scaler_y.transform(target).ravel().astype(np.float32),
+        'dates': dates,
+        'n_train': n_train,
+        'scaler_x': scaler_x,
+        'scaler_y': scaler_y,
+        'columns': feature_frame.columns,
+    }
+
+
+class WindowDataset:
+    """
+    Dataset cửa sổ trượt cho nhiều mã (dùng trực tiếp với torch DataLoader):
+    ma trận đặc trưng đã chuẩn hóa của mọi mã được nối thành một tensor duy nhất (mỗi mã lưu đúng
+    một lần), mỗi mẫu chỉ là vị trí bắt đầu cửa sổ; __getitem__ trả về một slice (view) của tensor đó.
+    Bộ nhớ không còn tăng theo sequence_length như khi tạo sẵn từng cửa sổ bằng vòng lặp.
+
+    Mẫu thứ k: X = features[s : s + sequence_length], y = target[s + sequence_length : s + sequence_length + horizon]
+    (horizon=1 -> y vô hướng, giống preprocess_data). Cửa sổ không bao giờ vượt qua ranh giới giữa hai mã.
+    Các dataset train / test tạo bởi build_window_datasets dùng chung cùng một tensor.
+    """
+
+    def __init__(self, features, target, starts, ticker_ids, codes, sequence_length, horizon=1,
+                 target_dates=None, return_ticker=False):
+        import torch
+
+        self.features = torch.as_tensor(features, dtype=torch.float32)
+        self.target = torch.as_tensor(target, dtype=torch.float32)
+        self.starts = torch.as_tensor(np.asarray(starts, dtype=np.int64))
+        self.ticker_ids = torch.as_tensor(np.asarray(ticker_ids, dtype=np.int64))
+        self.codes = list(codes)
+        self.sequence_length = sequence_length
+        self.horizon = horizon
+        self.target_dates = target_dates
+        # return_ticker=True: trả thêm chỉ số mã (ví dụ cho lớp embedding theo mã của mô hình chung)
+        self.return_ticker = return_ticker
+
+    @classmethod
+    def from_series(cls, features, target, sequence_length, horizon=1, stock_code=None, target_dates=None):
+        """
+        Dataset của một mã từ ma trận đặc trưng (T, F) và mục tiêu (T,) đã chuẩn hóa: mọi cửa sổ
+        features[s : s + sequence_length] -> target[s + sequence_length] (cùng thứ tự và số mẫu với
+        sequence_windows khi horizon=1), chỉ lưu ma trận đặc trưng một lần.
+        """
+        n_windows = max(len(features) - sequence_length - horizon + 1, 0)
+        starts = np.arange(n_windows)
+        if target_dates is not None:
+            target_dates = np.asarray(target_dates)[starts + sequence_length]
+        return cls(features, np.asarray(target).ravel(), starts, np.zeros(n_windows, dtype=np.int64), [stock_code],
+                   sequence_length, horizon, target_dates)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, idx):
+        start = int(self.starts[idx])
+        end = start + self.sequence_length
+        x = self.features[start:end]
+        y = self.target[end] if self.horizon == 1 else self.target[end:end + self.horizon]
+        if self.return_ticker:
+            return x, y, self.ticker_ids[idx]
+        return x, y
+
+    def window_batch(self, indices):
+        """
+        Lấy nhiều cửa sổ một lần qua unfold (view (N, F, L) trên tensor đặc trưng) - dùng khi dự đoán /
+        đánh giá cả tập thay vì đi qua DataLoader. Trả về (X (B, L, F), y).
+        """
+        import torch
+
+        indices = torch.as_tensor(indices, dtype=torch.int64)
+        starts = self.starts[indices]
+        windows = self.features.unfold(0, self.sequence_length, 1)
+        x = windows[starts].transpose(1, 2)
+        ends = starts + self.sequence_length
+        if self.horizon == 1:
+            return x, self.target[ends]
+        return x, self.target.unfold(0, self.horizon, 1)[ends]
+
+    def ticker_indices(self, stock_code):
+        """Chỉ số các mẫu của một mã (dùng với torch.utils.data.Subset để đánh giá từng mã bằng scaler_y riêng)"""
+        ticker_id = self.codes.index(stock_code)
+        return (self.ticker_ids == ticker_id).nonzero().flatten().tolist()
+
+    def share_memory(self):
+        """Đưa tensor vào shared memory để worker của DataLoader (kể cả kiểu spawn) không sao chép dữ liệu"""
+        self.features.share_memory_()
+        self.target.share_memory_()
+        self.starts.share_memory_()
+        self.ticker_ids.share_memory_()
+        return self
+
+
+def build_window_datasets(all_data, sequence_length, split_date='2024-01-01', target_column='closing_price',
+                          horizon=1, scaler_cls=StandardScaler, return_ticker=False):
+    """
+    Tạo dataset train / test chung cho tất cả các mã để huấn luyện một mô hình duy nhất.
+    Mỗi mã được chuẩn hóa bằng scaler riêng (fit trên phần train của mã đó, xem scale_ticker);
+    cửa sổ train có mục tiêu trước split_date, cửa sổ test nằm hoàn toàn sau split_date như preprocess_data.
+
+    Parameters:
+    -----------
+    all_data : dict
+        Dictionary {mã: DataFrame} (kết quả của read_data)
+    sequence_length : int
+        Độ dài cửa sổ
+    horizon : int
+        Số ngày mục tiêu của mỗi mẫu (1: dự báo một ngày)
+
+    Returns:
+    --------
+    (train_dataset, test_dataset, scalers) với scalers = {mã: (scaler_x, scaler_y)}
+    """
+    features, target, dates = [], [], []
+    train_starts, train_ids, test_starts, test_ids = [], [], [], []
+    scalers, codes = {}, []
+    columns = None
+    offset = 0
+    for stock_code, data in all_data.items():
+        try:
+            scaled = scale_ticker(data, split_date, target_column, scaler_cls)
+        except ValueError as e:
+            print(f"Bỏ qua mã {stock_code}: {e}")
+            continue
+        if columns is None:
+            columns = list(scaled['columns'])
+        elif list(scaled['columns']) != columns:
+            raise ValueError(f"Cột đặc trưng của mã {stock_code} khác các mã trước")
+
+        ticker_id = len(codes)
+        codes.append(stock_code)
+        scalers[stock_code] = (scaled['scaler_x'], scaled['scaler_y'])
+        n_rows, n_train = len(scaled['target']), scaled['n_train']
+
+        # Vị trí bắt đầu s hợp lệ: mục tiêu cuối s + sequence_length + horizon - 1 cùng phía split_date
+        train = np.arange(0, n_train - sequence_length - horizon + 1)
+        test = np.arange(n_train, n_rows - sequence_length - horizon + 1)
+        train_starts.append(train + offset)
+        test_starts.append(test + offset)
+        train_ids.append(np.full(len(train), ticker_id))
+        test_ids.append(np.full(len(test), ticker_id))
+
+        features.append(scaled['features'])
+        target.append(scaled['target'])
+        dates.append(scaled['dates'])
+        offset += n_rows
+
+    if not codes:
+        raise ValueError("Không có mã nào đủ dữ liệu")
+
+    features = np.concatenate(features)
+    target = np.concatenate(target)
+    dates = np.concatenate(dates)
+    train_starts, test_starts = np.concatenate(train_starts), np.concatenate(test_starts)
+
+    train_dataset = WindowDataset(features, target, train_starts, np.concatenate(train_ids), codes,
+                                  sequence_length, horizon, dates[train_starts + sequence_length], return_ticker)
+    # Dùng lại tensor của train_dataset, không tạo bản sao thứ hai
+    test_dataset = WindowDataset(train_dataset.features, train_dataset.target, test_starts, np.concatenate(test_ids),
+                                 codes, sequence_length, horizon, dates[test_starts + sequence_length], return_ticker)
+    return train_dataset, test_dataset, scalers
+
+
+class TickerBalancedSampler:
+    """
+    Sampler cho dataset nhiều mã: mỗi epoch lấy cùng số mẫu samples_per_ticker từ mỗi mã
+    (mặc định: trung vị số cửa sổ của các mã) rồi xáo trộn, để các mã có lịch sử dài không lấn át mô hình chung.
+    Mã có ít cửa sổ hơn được lấy lặp lại. Mỗi lần duyệt (mỗi epoch) dùng seed + epoch nên thứ tự khác nhau
+    nhưng tái lập được; set_epoch(epoch) để đặt lại epoch.
+    """
+
+    def __init__(self, dataset, samples_per_ticker=None, seed=0):
+        ticker_ids = np.asarray(dataset.ticker_ids)
+        order = np.argsort(ticker_ids, kind='stable')
+        counts = np.bincount(ticker_ids, minlength=len(dataset.codes))
+        self.groups = [group for group in np.split(order, np.cumsum(counts)[:-1]) if len(group)]
+        if samples_per_ticker is None:
+            samples_per_ticker = int(np.median([len(group) for group in self.groups])) if self.groups else 0
+        self.samples_per_ticker = samples_per_ticker
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return self.samples_per_ticker * len(self.groups)
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        picks = [rng.choice(group, self.samples_per_ticker, replace=len(group) < self.samples_per_ticker)
+                 for group in self.groups]
+        indices = np.concatenate(picks) if picks else np.empty(0, dtype=np.int64)
+        rng.shuffle(indices)
+        self.epoch += 1
+        return iter(indices.tolist())
+
+
+def make_dataloader(dataset, batch_size=256, sampler=None, shuffle=False, num_workers=0):
+    """
+    DataLoader cho WindowDataset: với num_workers > 0 tensor được đưa vào shared memory và worker được
+    giữ lại giữa các epoch (persistent_workers) nên không phải khởi tạo lại mỗi epoch.
+    """
+    from torch.utils.data import DataLoader
+
+    if num_workers > 0:
+        dataset.share_memory()
+    return DataLoader(dataset, batch_size=batch_size, sampler=sampler, shuffle=shuffle and sampler is None,
+                      num_workers=num_workers, persistent_workers=num_workers > 0)